@@ -3,7 +3,7 @@ import "bootstrap/dist/css/bootstrap.min.css";
 import { Github } from "react-bootstrap-icons";
 
 import { TransformWrapper, TransformComponent } from "react-zoom-pan-pinch";
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import Select, { SingleValue } from "react-select";
 import * as Scroll from "react-scroll";
 
@@ -11,6 +11,16 @@ namespace ApiResponse {
     export interface Generate {
         token: string;
     }
+    export interface Tile {
+        name: string;
+        offset_x: number;
+        offset_y: number;
+        width: number;
+        height: number;
+        device_width: number;
+        device_height: number;
+        image: string;
+    }
 }
 
 function App() {
@@ -35,6 +45,53 @@ function App() {
     const scroller = Scroll.scroller;
     var Element = Scroll.Element;
 
+    // NOTE: 描画が完了したパネルを順次重ねていくキャンバス
+    const tileCanvas = useRef<HTMLCanvasElement | null>(null);
+    const tileSource = useRef<EventSource | null>(null);
+    const tileActive = useRef(false);
+
+    const readTile = (token: string) => {
+        const query = new URLSearchParams({ token: token });
+        closeTile();
+        tileActive.current = true;
+        tileCanvas.current = null;
+        tileSource.current = new EventSource(API_ENDPOINT + "/tile?" + query);
+        tileSource.current.addEventListener("panel", (event) => {
+            const tile = JSON.parse((event as MessageEvent).data) as ApiResponse.Tile;
+            const tileImage = new Image();
+            tileImage.onload = () => {
+                if (!tileActive.current) {
+                    return;
+                }
+                if (tileCanvas.current === null) {
+                    tileCanvas.current = document.createElement("canvas");
+                    tileCanvas.current.width = tile.device_width;
+                    tileCanvas.current.height = tile.device_height;
+                    const context = tileCanvas.current.getContext("2d") as CanvasRenderingContext2D;
+                    context.fillStyle = "#FFFFFF";
+                    context.fillRect(0, 0, tile.device_width, tile.device_height);
+                }
+                (tileCanvas.current.getContext("2d") as CanvasRenderingContext2D).drawImage(
+                    tileImage,
+                    tile.offset_x,
+                    tile.offset_y
+                );
+                setImageSrc(tileCanvas.current.toDataURL());
+            };
+            tileImage.src = "data:image/png;base64," + tile.image;
+        });
+        tileSource.current.addEventListener("done", () => {
+            tileSource.current?.close();
+            tileSource.current = null;
+        });
+    };
+
+    const closeTile = () => {
+        tileActive.current = false;
+        tileSource.current?.close();
+        tileSource.current = null;
+    };
+
     const reqGenerate = () => {
         return new Promise((resolve) => {
             const query = new URLSearchParams({ mode: mode.value });
@@ -74,6 +131,7 @@ function App() {
         setError(false);
         setLog([]);
         setImageSrc(DEFAULT_IMAGE);
+        readTile(res.token);
         readLog(res.token);
     };
 
@@ -95,6 +153,8 @@ function App() {
             .then((reader) => {
                 function processChunk({ done, value }: ReadableStreamReadResult<Uint8Array>) {
                     if (done) {
+                        // NOTE: 最終的な画像で上書きされないように，パネル画像の受信は打ち切る
+                        closeTile();
                         readImage(token);
                         setFinish(true);
                         return;
@@ -3,21 +3,24 @@
 電子ペーパ表示用の画像を生成します．
 
 Usage:
-  create_image.py [-c CONFIG] [-s] [-o PNG_FILE] [-t] [-D] [-d]
+  create_image.py [-c CONFIG] [-s] [-o PNG_FILE] [-T TILE_DIR] [-t] [-D] [-d]
 
 Options:
   -c CONFIG         : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
   -s                : 小型ディスプレイモードで実行します．
   -o PNG_FILE       : 生成した画像を指定されたパスに保存します．
+  -T TILE_DIR       : 描画が完了したパネルを順次 TILE_DIR に保存します．
   -t                : テストモードで実行します．
   -D                : ダミーモードで実行します．
   -d                : デバッグモードで動作します．
 """
 
+import functools
 import logging
 import multiprocessing
 import os
 import pathlib
+import queue
 import sys
 import textwrap
 import time
@@ -30,6 +33,7 @@ sys.path.append(str(pathlib.Path(__file__).parent.parent / "lib"))
 
 import my_lib.panel_util
 import my_lib.pil_util
+import weather_display.file_util
 import weather_display.power_graph
 import weather_display.rain_cloud_panel
 import weather_display.rain_fall_panel
@@ -58,16 +62,16 @@ def draw_wall(config, img):
         )
 
 
-def draw_panel(config, img, is_small_mode=False):
+def get_panel_list(is_small_mode=False):
     if is_small_mode:
-        panel_list = [
+        return [
             {"name": "rain_cloud", "func": weather_display.rain_cloud_panel.create, "arg": (True,)},
             {"name": "weather", "func": weather_display.weather_panel.create, "arg": (False,)},
             {"name": "wbgt", "func": weather_display.wbgt_panel.create},
             {"name": "time", "func": weather_display.time_panel.create},
         ]
     else:
-        panel_list = [
+        return [
             {"name": "rain_cloud", "func": weather_display.rain_cloud_panel.create},
             {"name": "sensor", "func": weather_display.sensor_graph.create},
             {"name": "power", "func": weather_display.power_graph.create},
@@ -77,22 +81,49 @@ def draw_panel(config, img, is_small_mode=False):
             {"name": "time", "func": weather_display.time_panel.create},
         ]
 
+
+def get_panel_arg(config, panel):
+    arg = (config,)
+    if "arg" in panel:
+        arg += panel["arg"]
+
+    return arg
+
+
+def create_panel(config, name, is_small_mode=False):
+    panel = next((panel for panel in get_panel_list(is_small_mode) if panel["name"] == name), None)
+
+    if panel is None:
+        raise ValueError(f"Unknown panel: {name}")  # noqa: TRY003, EM102
+
+    logging.info("Create %s panel", name)
+
+    return panel["func"](*get_panel_arg(config, panel))
+
+
+def draw_panel(config, img, is_small_mode=False, panel_callback=None):
+    panel_list = get_panel_list(is_small_mode)
     panel_map = {}
 
     # NOTE: 並列処理 (matplotlib はマルチスレッド対応していないので，マルチプロセス処理する)
     start = time.perf_counter()
+    done_queue = queue.Queue()
     pool = multiprocessing.Pool(processes=len(panel_list))
     for panel in panel_list:
-        arg = (config,)
-        if "arg" in panel:
-            arg += panel["arg"]
-        panel["task"] = pool.apply_async(panel["func"], arg)
+        panel["task"] = pool.apply_async(
+            panel["func"],
+            get_panel_arg(config, panel),
+            callback=lambda _, name=panel["name"]: done_queue.put(name),
+            error_callback=lambda _, name=panel["name"]: done_queue.put(name),
+        )
 
     pool.close()
-    pool.join()
 
     ret = 0
-    for panel in panel_list:
+    # NOTE: 描画が完了した順に処理する
+    for _ in range(len(panel_list)):
+        name = done_queue.get()
+        panel = next(panel for panel in panel_list if panel["name"] == name)
         result = panel["task"].get()
         panel_img = result[0]
         elapsed = result[1]
@@ -112,7 +143,16 @@ def draw_panel(config, img, is_small_mode=False):
 
         panel_map[panel["name"]] = panel_img
 
+        if panel_callback is not None:
+            panel_callback(
+                panel["name"],
+                panel_img,
+                (config[panel["name"]]["panel"]["offset_x"], config[panel["name"]]["panel"]["offset_y"]),
+            )
+
         logging.info("elapsed time: %s panel = %.3f sec", panel["name"], elapsed)
+
+    pool.join()
     logging.info("total elapsed time: %.3f sec", time.perf_counter() - start)
 
     draw_wall(config, img)
@@ -133,7 +173,30 @@ def draw_panel(config, img, is_small_mode=False):
     return ret
 
 
-def create_image(config, small_mode=False, dummy_mode=False, test_mode=False):
+def save_panel_tile(config, tile_dir, name, panel_img, offset):
+    # NOTE: 描画が完了したパネルを順次保存する．JSON を最後に書き出すので，
+    # JSON が存在すれば画像も揃っている．
+    tile_dir = pathlib.Path(tile_dir)
+    # NOTE: 最終的な画像と同じく，グレースケールに変換しておく
+    my_lib.pil_util.convert_to_gray(panel_img).save(tile_dir / f"{name}.png", "PNG")
+
+    weather_display.file_util.save_json(
+        tile_dir / f"{name}.json",
+        {
+            "name": name,
+            "offset_x": offset[0],
+            "offset_y": offset[1],
+            "width": panel_img.size[0],
+            "height": panel_img.size[1],
+            "device_width": config["panel"]["device"]["width"],
+            "device_height": config["panel"]["device"]["height"],
+        },
+    )
+
+
+def create_image(  # noqa: PLR0913
+    config, small_mode=False, dummy_mode=False, test_mode=False, panel_callback=None
+):
     # NOTE: オプションでダミーモードが指定された場合，環境変数もそれに揃えておく
     if dummy_mode:
         logging.warning("Set dummy mode")
@@ -153,7 +216,7 @@ def create_image(config, small_mode=False, dummy_mode=False, test_mode=False):
         return (img, 0)
 
     try:
-        ret = draw_panel(config, img, small_mode)
+        ret = draw_panel(config, img, small_mode, panel_callback)
 
         return (img, ret)
     except Exception:
@@ -206,6 +269,7 @@ if __name__ == "__main__":
 
     log_level = logging.DEBUG if debug_mode else logging.INFO
     out_file = args["-o"] if args["-o"] is not None else sys.stdout.buffer
+    tile_dir = args["-T"]
 
     my_lib.logger.init("panel.e-ink.weather", level=log_level)
 
@@ -213,7 +277,13 @@ if __name__ == "__main__":
         config_file, pathlib.Path(SCHEMA_CONFIG_SMALL if small_mode else SCHEMA_CONFIG)
     )
 
-    img, status = create_image(config, small_mode, dummy_mode, test_mode)
+    img, status = create_image(
+        config,
+        small_mode,
+        dummy_mode,
+        test_mode,
+        functools.partial(save_panel_tile, config, tile_dir) if tile_dir is not None else None,
+    )
 
     logging.info("Save %s.", out_file)
     my_lib.pil_util.convert_to_gray(img).save(out_file, "PNG")
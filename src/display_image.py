@@ -27,6 +27,7 @@ import create_image
 import my_lib.footprint
 import my_lib.panel_util
 import paramiko
+import weather_display.file_util
 from docopt import docopt
 
 SCHEMA_CONFIG = "config.schema"
@@ -86,6 +87,14 @@ def ssh_kill_and_close(ssh, cmd):
         raise
 
 
+def save_frame(config, image_data):
+    # NOTE: Web アプリから最新の画像として配信できるように，表示した画像を保存しておく
+    if ("frame" not in config["panel"]) or (len(image_data) == 0):
+        return
+
+    weather_display.file_util.write_bytes(config["panel"]["frame"]["file"], image_data)
+
+
 def display_image(  # noqa: PLR0913, PLR0912, C901
     config,
     rasp_hostname,
@@ -119,7 +128,8 @@ def display_image(  # noqa: PLR0913, PLR0912, C901
         cmd.append("-t")
 
     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)  # noqa: S603
-    ssh_stdin.write(proc.communicate()[0])
+    image_data = proc.communicate()[0]
+    ssh_stdin.write(image_data)
     proc.wait()
 
     ssh_stdin.flush()
@@ -129,6 +139,9 @@ def display_image(  # noqa: PLR0913, PLR0912, C901
 
     fbi_status = ssh_stdout.channel.recv_exit_status()
 
+    if proc.returncode != create_image.ERROR_CODE_MAJOR:
+        save_frame(config, image_data)
+
     # NOTE: -24 は create_image.py の異常時の終了コードに合わせる．
     if (fbi_status == 0) and (proc.returncode == 0):
         logging.info("Succeeded.")
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+ファイルの保存と読み込みに関する共通の処理です．
+
+保存したファイルは他のプロセスからも読まれるので，書き込み途中の内容が読まれないように，
+一時ファイルに書き込んでから置き換えます．
+"""
+
+import json
+import pathlib
+
+
+def write_atomic(path, write_func, is_binary=True):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb" if is_binary else "w") as f:
+        write_func(f)
+    tmp_path.replace(path)
+
+
+def write_bytes(path, data):
+    write_atomic(path, lambda f: f.write(data))
+
+
+def save_json(path, data):
+    write_atomic(path, lambda f: json.dump(data, f), False)
+
+
+def load_json(path):
+    if not path.exists():
+        return None
+
+    with path.open() as f:
+        return json.load(f)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+パネル間で共有するフォント関連の処理です．
+
+フォントの読み込みや文字列の大きさの計測は描画のたびに繰り返されるので，
+結果をプロセス内でキャッシュします．
+"""
+
+import logging
+import pathlib
+import threading
+
+import my_lib.pil_util
+import PIL.Image
+
+# NOTE: 文字列の大きさの計測に使う画像 (描画先の大きさには依存しない)
+MEASURE_IMAGE = PIL.Image.new("RGBA", (1, 1))
+
+font_cache = {}
+font_lock = threading.Lock()
+
+text_size_cache = {}
+text_size_lock = threading.Lock()
+
+
+def get_font_path(font_config, font_type):
+    return pathlib.Path(font_config["path"]).resolve() / font_config["map"][font_type]
+
+
+def get_font(font_config, font_type, size):
+    key = ("pil", get_font_path(font_config, font_type), size)
+
+    with font_lock:
+        if key not in font_cache:
+            font_cache[key] = my_lib.pil_util.get_font(font_config, font_type, size)
+
+        return font_cache[key]
+
+
+def get_plot_font(font_config, font_type, size):
+    # NOTE: matplotlib を使わないパネルでは読み込まないようにする
+    import matplotlib.font_manager
+
+    font_path = get_font_path(font_config, font_type)
+    key = ("plot", font_path, size)
+
+    with font_lock:
+        if key not in font_cache:
+            logging.info("Load font: %s", font_path)
+            font_cache[key] = matplotlib.font_manager.FontProperties(fname=font_path, size=size)
+
+        return font_cache[key]
+
+
+def get_font_key(font):
+    return (font.path, font.size)
+
+
+def text_size(font, text):
+    key = (get_font_key(font), text)
+
+    with text_size_lock:
+        if key in text_size_cache:
+            return text_size_cache[key]
+
+        size = my_lib.pil_util.text_size(MEASURE_IMAGE, font, text)
+        text_size_cache[key] = size
+
+    return size
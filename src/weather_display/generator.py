@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
 
+import base64
+import datetime
+import hashlib
 import io
+import json
+import logging
+import multiprocessing
+import multiprocessing.util
 import pathlib
+import queue
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 import traceback
@@ -11,31 +20,305 @@ import uuid
 from multiprocessing import Queue
 from multiprocessing.pool import ThreadPool
 
-from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+import PIL.features
+import PIL.Image
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 
 sys.path.append(str(pathlib.Path(__file__).parent.parent / "lib"))
 
+import create_image
+import my_lib.config
 import my_lib.flask_util
+import my_lib.pil_util
+import weather_display.rain_cloud_panel
+
+# NOTE: 事前生成した画像の更新要否を確認する間隔
+PRERENDER_CHECK_SEC = 10
+
+# NOTE: Accept ヘッダに応じて配信する画像形式 (先頭ほど優先)
+IMAGE_VARIANT_LIST = [
+    {"mimetype": "image/webp", "feature": "webp", "format": "WEBP", "option": {"lossless": True}},
+    {"mimetype": "image/avif", "feature": "avif", "format": "AVIF", "option": {"quality": 90}},
+]
+IMAGE_VARIANT_LIST = [variant for variant in IMAGE_VARIANT_LIST if PIL.features.check(variant["feature"])]
+
+# NOTE: 雨雲の予報のアニメーションの各フレームの表示時間
+NOWCAST_FRAME_MSEC = 500
 
 blueprint = Blueprint("webapp", __name__, url_prefix="/")
 
 thread_pool = None
+panel_pool = None
 panel_data_map = {}
 create_image_path = None
 
+prerender_thread = None
+prerender_stop_event = threading.Event()
+latest_image_map = {}
+nowcast_image_cache = {}
+requested_mode_set = set()
+
 
-def init(create_image_path_):
+def init(create_image_path_, prerender_param=None):
     global thread_pool  # noqa: PLW0603
+    global panel_pool  # noqa: PLW0603
     global create_image_path  # noqa: PLW0603
 
+    # NOTE: パネル単体の描画は常駐プロセスで行い，プロセス内のキャッシュを使い回す．
+    # スレッドを生成する前に fork しておく．
+    panel_pool = multiprocessing.Pool(processes=1, initializer=init_panel_worker)
     thread_pool = ThreadPool(processes=3)
     create_image_path = create_image_path_
 
+    if prerender_param is not None:
+        prerender_start(prerender_param)
+
+
+def init_panel_worker():
+    # NOTE: 常駐プロセスではブラウザを起動したままにして，次回の描画で使い回す
+    weather_display.rain_cloud_panel.keep_driver()
+    multiprocessing.util.Finalize(None, weather_display.rain_cloud_panel.term, exitpriority=10)
+
 
 def term():
     global thread_pool
+    global panel_pool
 
+    prerender_stop()
     thread_pool.close()
+    # NOTE: 常駐プロセスが終了処理 (ブラウザの終了) を終えるのを待つ．待たないと，
+    # 終了時に強制終了されてブラウザが残る．
+    panel_pool.close()
+    panel_pool.join()
+
+
+def get_mode(is_small_mode):
+    return "small" if is_small_mode else "normal"
+
+
+def get_config_file(app_config, is_small_mode):
+    # NOTE: Flask と Quart のどちらからも使えるように，アプリの設定を受け取る
+    return app_config["CONFIG_FILE_SMALL"] if is_small_mode else app_config["CONFIG_FILE_NORMAL"]
+
+
+def create_image_cmd(config_file, is_small_mode, is_dummy_mode, is_test_mode, tile_dir=None):  # noqa: PLR0913
+    cmd = ["python3", create_image_path, "-c", config_file]
+    if is_small_mode:
+        cmd.append("-s")
+    if is_dummy_mode:
+        cmd.append("-D")
+    if is_test_mode:
+        cmd.append("-t")
+    if tile_dir is not None:
+        cmd.extend(["-T", str(tile_dir)])
+
+    return cmd
+
+
+def update_latest_image(mode, image_data, update_time=None):
+    global latest_image_map
+
+    latest_image_map[mode] = {
+        "image": image_data,
+        "variant": create_image_variant(image_data),
+        "time": time.time() if update_time is None else update_time,
+    }
+
+
+def create_image_variant(image_data):
+    # NOTE: 画像形式ごとのエンコード結果を保持し，同じ画像を何度もエンコードしないようにする
+    return {
+        "digest": hashlib.sha256(image_data).hexdigest()[:32],
+        "data": {"image/png": image_data},
+    }
+
+
+def get_image_variant(image_variant, mimetype):
+    if mimetype not in image_variant["data"]:
+        variant = next(variant for variant in IMAGE_VARIANT_LIST if variant["mimetype"] == mimetype)
+        img_stream = io.BytesIO()
+        PIL.Image.open(io.BytesIO(image_variant["data"]["image/png"])).save(
+            img_stream, variant["format"], **variant["option"]
+        )
+        image_variant["data"][mimetype] = img_stream.getvalue()
+
+    return image_variant["data"][mimetype]
+
+
+def select_image_mimetype(accept_mimetypes):
+    # NOTE: */* 等のワイルドカードでは PNG を返し，明示的に受け入れる形式の場合のみ変換する
+    accept_list = [value for value, quality in accept_mimetypes if quality > 0]
+
+    return next(
+        (variant["mimetype"] for variant in IMAGE_VARIANT_LIST if variant["mimetype"] in accept_list),
+        "image/png",
+    )
+
+
+def get_image_etag(image_variant, mimetype):
+    # NOTE: 画像形式ごとに別の ETag にする
+    return f"{image_variant['digest']}-{mimetype.split('/')[1]}"
+
+
+def get_token_image_variant(panel_data):
+    if "variant" not in panel_data:
+        panel_data["variant"] = create_image_variant(panel_data["image"])
+
+    return panel_data["variant"]
+
+
+def image_response(image_variant):
+    mimetype = select_image_mimetype(request.accept_mimetypes)
+    etag = get_image_etag(image_variant, mimetype)
+
+    # NOTE: make_conditional は GET と HEAD でしか 304 を返さないので，POST のために自前で判定する
+    if request.if_none_match.contains(etag):
+        res = Response("", status=304)
+    else:
+        res = Response(get_image_variant(image_variant, mimetype), mimetype=mimetype)
+
+    res.set_etag(etag)
+    res.vary.add("Accept")
+    # NOTE: キャッシュはしてもよいが，毎回 If-None-Match で確認させる
+    res.headers["Cache-Control"] = "no-cache"
+
+    return res
+
+
+def render_latest_image(config_file, is_small_mode, is_dummy_mode, is_test_mode=False):
+    mode = get_mode(is_small_mode)
+    logging.info("Prerender image (mode: %s)", mode)
+
+    proc = subprocess.run(  # noqa: S603
+        create_image_cmd(config_file, is_small_mode, is_dummy_mode, is_test_mode),
+        capture_output=True,
+        check=False,
+    )
+
+    if (proc.returncode == create_image.ERROR_CODE_MAJOR) or (len(proc.stdout) == 0):
+        logging.warning("Failed to prerender image (mode: %s, code: %d)", mode, proc.returncode)
+        logging.warning(proc.stderr.decode("utf-8"))
+        return False
+
+    update_latest_image(mode, proc.stdout)
+
+    return True
+
+
+def load_frame_file(mode, frame_file):
+    # NOTE: display_image.py が生成した画像があり，事前生成した画像より新しければ取り込む
+    if (frame_file is None) or (not frame_file.exists()):
+        return False
+
+    mtime = frame_file.stat().st_mtime
+    if (mode in latest_image_map) and (latest_image_map[mode]["time"] >= mtime):
+        return False
+
+    logging.info("Load frame file: %s", frame_file)
+    update_latest_image(mode, frame_file.read_bytes(), mtime)
+
+    return True
+
+
+def request_latest_image(mode):
+    # NOTE: 一度でも要求されたモードの画像は，以降は事前生成しておく
+    requested_mode_set.add(mode)
+
+
+def load_prerender_target(prerender_param, is_small_mode):
+    mode = get_mode(is_small_mode)
+    config_file = prerender_param["config_file"][mode]
+
+    try:
+        config = my_lib.config.load(config_file)
+    except Exception:
+        logging.exception("Failed to load config for prerender (mode: %s)", mode)
+        return None
+
+    return {
+        "mode": mode,
+        "is_small_mode": is_small_mode,
+        "config_file": config_file,
+        "frame_file": (
+            pathlib.Path(config["panel"]["frame"]["file"]) if "frame" in config["panel"] else None
+        ),
+        "interval": config["panel"]["update"]["interval"],
+    }
+
+
+def is_prerender_needed(target):
+    # NOTE: 要求されたことがなく，display_image.py の画像も無いモードは生成しない
+    if (target["mode"] not in requested_mode_set) and (
+        (target["frame_file"] is None) or (not target["frame_file"].exists())
+    ):
+        return False
+
+    return (target["mode"] not in latest_image_map) or (
+        (time.time() - latest_image_map[target["mode"]]["time"]) >= target["interval"]
+    )
+
+
+def prefetch_rain_cloud(target):
+    # NOTE: 雨雲画像は常駐プロセスのブラウザで取得してキャッシュしておき，create_image.py では
+    # ブラウザを起動せずにキャッシュを使わせる
+    try:
+        render_panel(target["config_file"], "rain_cloud", target["is_small_mode"])
+    except Exception:
+        logging.exception("Failed to prefetch rain cloud image (mode: %s)", target["mode"])
+
+
+def prerender_worker(prerender_param):
+    # NOTE: 設定ファイルを読めないモードは，事前生成の対象から外す
+    target_list = [
+        target
+        for target in (
+            load_prerender_target(prerender_param, is_small_mode) for is_small_mode in [False, True]
+        )
+        if target is not None
+    ]
+
+    while True:
+        for target in target_list:
+            try:
+                if load_frame_file(target["mode"], target["frame_file"]):
+                    continue
+
+                if not is_prerender_needed(target):
+                    continue
+
+                prefetch_rain_cloud(target)
+                render_latest_image(
+                    target["config_file"],
+                    target["is_small_mode"],
+                    prerender_param["is_dummy_mode"],
+                )
+            except Exception:
+                logging.exception("Failed to prerender image")
+
+            if prerender_stop_event.is_set():
+                return
+
+        if prerender_stop_event.wait(PRERENDER_CHECK_SEC):
+            return
+
+
+def prerender_start(prerender_param):
+    global prerender_thread  # noqa: PLW0603
+
+    prerender_stop_event.clear()
+    prerender_thread = threading.Thread(target=prerender_worker, args=(prerender_param,), daemon=True)
+    prerender_thread.start()
+
+
+def prerender_stop():
+    global prerender_thread  # noqa: PLW0603
+
+    if prerender_thread is None:
+        return
+
+    prerender_stop_event.set()
+    prerender_thread.join()
+    prerender_thread = None
 
 
 def image_reader(proc, token):
@@ -53,43 +336,150 @@ def image_reader(proc, token):
     panel_data["image"] = img_stream.getvalue()
 
 
+def tile_reader(tile_dir, token):
+    global panel_data_map
+
+    # NOTE: 誰も受け取らないまま clean_map で削除された場合は，以降のパネル画像は捨てる
+    panel_data = panel_data_map.get(token)
+    if panel_data is None:
+        return
+
+    for json_path in sorted(tile_dir.glob("*.json")):
+        if json_path.name in panel_data["tile_done"]:
+            continue
+        panel_data["tile_done"].add(json_path.name)
+
+        with json_path.open() as f:
+            tile = json.load(f)
+        tile["image"] = base64.b64encode(json_path.with_suffix(".png").read_bytes()).decode("ascii")
+
+        panel_data["tile"].put(tile)
+
+
 def generate_image_impl(config_file, is_small_mode, is_dummy_mode, is_test_mode, token):
     global panel_data_map
 
     panel_data = panel_data_map[token]
-    cmd = ["python3", create_image_path, "-c", config_file]
-    if is_small_mode:
-        cmd.append("-s")
-    if is_dummy_mode:
-        cmd.append("-D")
-    if is_test_mode:
-        cmd.append("-t")
 
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)  # noqa: S603
+    with tempfile.TemporaryDirectory() as tile_dir:
+        tile_dir = pathlib.Path(tile_dir)
+        cmd = create_image_cmd(config_file, is_small_mode, is_dummy_mode, is_test_mode, tile_dir)
 
-    # NOTE: stdout も同時に読まないと，proc.poll の結果が None から
-    # 変化してくれないので注意．
-    thread = threading.Thread(target=image_reader, args=(proc, token))
-    thread.start()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False)  # noqa: S603
 
-    while True:
-        state = proc.poll()
-        line = proc.stderr.readline()
-        if line == b"":
-            if state is not None:
-                break
-            time.sleep(0.5)
-            continue
+        # NOTE: stdout も同時に読まないと，proc.poll の結果が None から
+        # 変化してくれないので注意．
+        thread = threading.Thread(target=image_reader, args=(proc, token))
+        thread.start()
 
-        panel_data["log"].put(line)
-        time.sleep(0.1)
+        while True:
+            state = proc.poll()
+            line = proc.stderr.readline()
+            # NOTE: パネルの描画が完了するとログが出力されるので，その都度確認する
+            tile_reader(tile_dir, token)
+            if line == b"":
+                if state is not None:
+                    break
+                time.sleep(0.5)
+                continue
+
+            panel_data["log"].put(line)
+            time.sleep(0.1)
+
+        thread.join()
+        tile_reader(tile_dir, token)
 
-    thread.join()
+    # NOTE: None を積むことで，パネル画像の送信完了を通知
+    panel_data["tile"].put(None)
+
+    # NOTE: 強制的に生成した画像も，最新の画像として配信できるようにする
+    if (not is_test_mode) and (proc.returncode != create_image.ERROR_CODE_MAJOR) and panel_data["image"]:
+        update_latest_image(get_mode(is_small_mode), panel_data["image"])
 
     # NOTE: None を積むことで，実行完了を通知
     panel_data["log"].put(None)
 
 
+def create_panel_image(config, name, is_small_mode):
+    result = create_image.create_panel(config, name, is_small_mode)
+
+    img_stream = io.BytesIO()
+    my_lib.pil_util.convert_to_gray(result[0]).save(img_stream, "PNG")
+
+    return (img_stream.getvalue(), *result[1:])
+
+
+def is_panel_exist(name, is_small_mode):
+    return name in [panel["name"] for panel in create_image.get_panel_list(is_small_mode)]
+
+
+def render_panel(config_file, name, is_small_mode):
+    global panel_pool
+
+    config = my_lib.config.load(config_file)
+
+    result = panel_pool.apply(create_panel_image, (config, name, is_small_mode))
+    if len(result) > 2:
+        logging.warning("Failed to draw %s panel: %s", name, result[2])
+
+    return result
+
+
+def encode_nowcast(sequence):
+    frame_list = [my_lib.pil_util.convert_to_gray(frame) for frame in sequence["frame"]]
+    img_stream = io.BytesIO()
+    frame_list[0].save(
+        img_stream,
+        "PNG",
+        save_all=True,
+        append_images=frame_list[1:],
+        duration=NOWCAST_FRAME_MSEC,
+        loop=0,
+    )
+
+    return img_stream.getvalue()
+
+
+def create_nowcast(config, step_min):
+    global nowcast_image_cache  # noqa: PLW0603
+
+    sequence = weather_display.rain_cloud_panel.create_nowcast_sequence(
+        config["rain_cloud"], config["font"], step_min
+    )
+
+    # NOTE: 予報が更新されていなければ同じ sequence が返るので，エンコード済みの画像を使い回す
+    if nowcast_image_cache.get("sequence") is not sequence:
+        nowcast_image_cache = {"sequence": sequence, "image": encode_nowcast(sequence)}
+
+    return (
+        {key: value for key, value in sequence.items() if key != "frame"},
+        nowcast_image_cache["image"],
+    )
+
+
+def is_nowcast_available(config_file):
+    config = my_lib.config.load(config_file)
+
+    return weather_display.rain_cloud_panel.is_nowcast_available(config["rain_cloud"])
+
+
+def render_nowcast(config_file, step_min):
+    global panel_pool
+
+    config = my_lib.config.load(config_file)
+
+    return panel_pool.apply(create_nowcast, (config, step_min))
+
+
+def nowcast_image_response(image_data):
+    # NOTE: アニメーションを保つため，画像形式は変換せずに APNG で返す
+    res = Response(image_data, mimetype="image/png")
+    res.set_etag(hashlib.sha256(image_data).hexdigest()[:32])
+    res.headers["Cache-Control"] = "no-cache"
+
+    return res
+
+
 def clean_map():
     global panel_data_map
 
@@ -107,6 +497,7 @@ def generate_image(config_file, is_small_mode, is_dummy_mode, is_test_mode):
     global panel_data_map
 
     clean_map()
+    request_latest_image(get_mode(is_small_mode))
 
     token = str(uuid.uuid4())
     log_queue = Queue()
@@ -114,6 +505,9 @@ def generate_image(config_file, is_small_mode, is_dummy_mode, is_test_mode):
     panel_data_map[token] = {
         "lock": threading.Lock(),
         "log": log_queue,
+        # NOTE: パネル画像は大きいので，読まれなくても詰まらないスレッド間のキューにする
+        "tile": queue.Queue(),
+        "tile_done": set(),
         "image": None,
         "time": time.time(),
     }
@@ -125,23 +519,88 @@ def generate_image(config_file, is_small_mode, is_dummy_mode, is_test_mode):
     return token
 
 
+# NOTE: PNG は圧縮済みなので gzip はかけず，ETag と画像形式の選択で転送量を減らす
 @blueprint.route("/weather_panel/api/image", methods=["POST"])
-@my_lib.flask_util.gzipped
 def api_image():
     global panel_data_map
 
-    # NOTE: @gzipped をつけた場合，キャッシュ用のヘッダを付与しているので，
-    # 無効化する．
-    g.disable_cache = True
-
     token = request.form.get("token", "")
 
     if token not in panel_data_map:
         return f"Invalid token: {token}"
 
-    image_data = panel_data_map[token]["image"]
+    panel_data = panel_data_map[token]
+
+    if panel_data["image"] is None:
+        return Response(f"Image is not ready: {token}", status=503)
+
+    return image_response(get_token_image_variant(panel_data))
 
-    return Response(image_data, mimetype="image/png")
+
+@blueprint.route("/weather_panel/api/image", methods=["GET"])
+def api_image_latest():
+    global latest_image_map
+
+    mode = request.args.get("mode", "")
+    mode = get_mode(mode == "small")
+
+    request_latest_image(mode)
+
+    if mode not in latest_image_map:
+        return Response(f"Image is not ready: {mode}", status=503)
+
+    res = image_response(latest_image_map[mode]["variant"])
+    res.last_modified = datetime.datetime.fromtimestamp(latest_image_map[mode]["time"], datetime.timezone.utc)
+
+    return res
+
+
+@blueprint.route("/weather_panel/api/panel/<name>", methods=["GET"])
+def api_panel(name):
+    mode = request.args.get("mode", "")
+    is_small_mode = mode == "small"
+
+    if not is_panel_exist(name, is_small_mode):
+        return Response(f"Unknown panel: {name}", status=404)
+
+    config_file = get_config_file(current_app.config, is_small_mode)
+    result = render_panel(config_file, name, is_small_mode)
+
+    res = image_response(create_image_variant(result[0]))
+    res.headers.add("Server-Timing", f"render;dur={result[1] * 1000:.1f}")
+
+    return res
+
+
+def get_nowcast_param():
+    is_small_mode = request.args.get("mode", "") == "small"
+    config_file = get_config_file(current_app.config, is_small_mode)
+    step_min = request.args.get("step", weather_display.rain_cloud_panel.NOWCAST_STEP_MIN, type=int)
+
+    if step_min not in weather_display.rain_cloud_panel.NOWCAST_STEP_MIN_LIST:
+        return (config_file, step_min, Response(f"Invalid step: {step_min}", status=400))
+    if not is_nowcast_available(config_file):
+        return (config_file, step_min, Response("Nowcast is not configured", status=404))
+
+    return (config_file, step_min, None)
+
+
+@blueprint.route("/weather_panel/api/nowcast", methods=["GET"])
+def api_nowcast():
+    config_file, step_min, error = get_nowcast_param()
+    if error is not None:
+        return error
+
+    return jsonify(render_nowcast(config_file, step_min)[0])
+
+
+@blueprint.route("/weather_panel/api/nowcast/image", methods=["GET"])
+def api_nowcast_image():
+    config_file, step_min, error = get_nowcast_param()
+    if error is not None:
+        return error
+
+    return nowcast_image_response(render_nowcast(config_file, step_min)[1]).make_conditional(request)
 
 
 @blueprint.route("/weather_panel/api/log", methods=["POST"])
@@ -176,6 +635,40 @@ def api_log():
     return res
 
 
+@blueprint.route("/weather_panel/api/tile", methods=["GET"])
+def api_tile():
+    global panel_data_map
+
+    token = request.args.get("token", "")
+
+    if token not in panel_data_map:
+        return f"Invalid token: {token}"
+
+    tile_queue = panel_data_map[token]["tile"]
+
+    # NOTE: 描画が完了したパネルから順に Server-Sent Events で送る
+    def generate():
+        while True:
+            while not tile_queue.empty():
+                tile = tile_queue.get()
+                if tile is None:
+                    break
+                yield f"event: panel\ndata: {json.dumps(tile)}\n\n"
+            else:
+                time.sleep(0.2)
+                continue
+            break
+
+        yield "event: done\ndata: \n\n"
+
+    res = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    res.headers.add("Access-Control-Allow-Origin", "*")
+    res.headers.add("Cache-Control", "no-cache")
+    res.headers.add("X-Accel-Buffering", "no")
+
+    return res
+
+
 @blueprint.route("/weather_panel/api/run", methods=["GET"])
 @my_lib.flask_util.support_jsonp
 def api_run():
@@ -183,9 +676,7 @@ def api_run():
     is_small_mode = mode == "small"
     is_test_mode = request.args.get("test", False, type=bool)
 
-    config_file = (
-        current_app.config["CONFIG_FILE_SMALL"] if is_small_mode else current_app.config["CONFIG_FILE_NORMAL"]
-    )
+    config_file = get_config_file(current_app.config, is_small_mode)
     is_dummy_mode = current_app.config["DUMMY_MODE"]
 
     try:
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+weather_display.generator の API を asyncio ベースで提供します．
+
+ログやパネル画像のストリーミングはコルーチンで処理し，画像の生成やエンコードは
+executor で実行するので，閲覧者が増えてもクライアントごとにスレッドを消費しません．
+"""
+
+import asyncio
+import datetime
+import functools
+import hashlib
+import json
+import traceback
+
+from quart import Blueprint, Response, current_app, jsonify, request
+
+import weather_display.generator as generator
+import weather_display.rain_cloud_panel
+
+URL_PREFIX = "/weather_panel/api"
+
+# NOTE: Quart 側で処理する API (それ以外は Flask 側で処理する)
+ASYNC_API_LIST = ["run", "log", "tile", "image", "panel", "nowcast"]
+
+STREAM_POLL_SEC = 0.2
+
+blueprint = Blueprint("webapp-async", __name__, url_prefix="/")
+
+
+def is_async_path(path):
+    if not path.startswith(f"{URL_PREFIX}/"):
+        return False
+
+    return path[len(URL_PREFIX) + 1 :].split("/")[0] in ASYNC_API_LIST
+
+
+async def run_in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+def stream_header(res):
+    res.headers.add("Access-Control-Allow-Origin", "*")
+    res.headers.add("Cache-Control", "no-cache")
+    res.headers.add("X-Accel-Buffering", "no")
+
+    return res
+
+
+async def image_response(image_variant, last_modified=None):
+    mimetype = generator.select_image_mimetype(request.accept_mimetypes)
+    etag = generator.get_image_etag(image_variant, mimetype)
+
+    if request.if_none_match.contains(etag):
+        res = Response("", status=304)
+    else:
+        # NOTE: WebP 等へのエンコードは重いので，イベントループを止めないようにする
+        image_data = await run_in_executor(generator.get_image_variant, image_variant, mimetype)
+        res = Response(image_data, mimetype=mimetype)
+
+    res.set_etag(etag)
+    res.vary.add("Accept")
+    res.headers["Cache-Control"] = "no-cache"
+    if last_modified is not None:
+        res.last_modified = last_modified
+
+    return res
+
+
+async def stream_queue(queue):
+    while True:
+        while not queue.empty():
+            item = queue.get()
+            if item is None:
+                return
+            yield item
+
+        await asyncio.sleep(STREAM_POLL_SEC)
+
+
+@blueprint.route(f"{URL_PREFIX}/image", methods=["POST"])
+async def api_image():
+    token = (await request.form).get("token", "")
+
+    if token not in generator.panel_data_map:
+        return f"Invalid token: {token}"
+
+    panel_data = generator.panel_data_map[token]
+
+    if panel_data["image"] is None:
+        return Response(f"Image is not ready: {token}", status=503)
+
+    image_variant = await run_in_executor(generator.get_token_image_variant, panel_data)
+
+    return await image_response(image_variant)
+
+
+@blueprint.route(f"{URL_PREFIX}/image", methods=["GET"])
+async def api_image_latest():
+    mode = generator.get_mode(request.args.get("mode", "") == "small")
+
+    generator.request_latest_image(mode)
+
+    if mode not in generator.latest_image_map:
+        return Response(f"Image is not ready: {mode}", status=503)
+
+    latest_image = generator.latest_image_map[mode]
+
+    return await image_response(
+        latest_image["variant"],
+        datetime.datetime.fromtimestamp(latest_image["time"], datetime.timezone.utc),
+    )
+
+
+@blueprint.route(f"{URL_PREFIX}/panel/<name>", methods=["GET"])
+async def api_panel(name):
+    is_small_mode = request.args.get("mode", "") == "small"
+
+    if not generator.is_panel_exist(name, is_small_mode):
+        return Response(f"Unknown panel: {name}", status=404)
+
+    config_file = generator.get_config_file(current_app.config, is_small_mode)
+    result = await run_in_executor(generator.render_panel, config_file, name, is_small_mode)
+
+    res = await image_response(generator.create_image_variant(result[0]))
+    res.headers.add("Server-Timing", f"render;dur={result[1] * 1000:.1f}")
+
+    return res
+
+
+async def get_nowcast_param():
+    is_small_mode = request.args.get("mode", "") == "small"
+    config_file = generator.get_config_file(current_app.config, is_small_mode)
+    step_min = request.args.get("step", weather_display.rain_cloud_panel.NOWCAST_STEP_MIN, type=int)
+
+    if step_min not in weather_display.rain_cloud_panel.NOWCAST_STEP_MIN_LIST:
+        return (config_file, step_min, Response(f"Invalid step: {step_min}", status=400))
+    if not await run_in_executor(generator.is_nowcast_available, config_file):
+        return (config_file, step_min, Response("Nowcast is not configured", status=404))
+
+    return (config_file, step_min, None)
+
+
+@blueprint.route(f"{URL_PREFIX}/nowcast", methods=["GET"])
+async def api_nowcast():
+    config_file, step_min, error = await get_nowcast_param()
+    if error is not None:
+        return error
+
+    result = await run_in_executor(generator.render_nowcast, config_file, step_min)
+
+    return jsonify(result[0])
+
+
+@blueprint.route(f"{URL_PREFIX}/nowcast/image", methods=["GET"])
+async def api_nowcast_image():
+    config_file, step_min, error = await get_nowcast_param()
+    if error is not None:
+        return error
+
+    result = await run_in_executor(generator.render_nowcast, config_file, step_min)
+
+    # NOTE: アニメーションを保つため，画像形式は変換せずに APNG で返す
+    etag = hashlib.sha256(result[1]).hexdigest()[:32]
+    res = (
+        Response("", status=304)
+        if request.if_none_match.contains(etag)
+        else Response(result[1], mimetype="image/png")
+    )
+    res.set_etag(etag)
+    res.headers["Cache-Control"] = "no-cache"
+
+    return res
+
+
+@blueprint.route(f"{URL_PREFIX}/log", methods=["POST"])
+async def api_log():
+    token = (await request.form).get("token", "")
+
+    if token not in generator.panel_data_map:
+        return f"Invalid token: {token}"
+
+    log_queue = generator.panel_data_map[token]["log"]
+
+    async def generate():
+        async for log in stream_queue(log_queue):
+            yield log.decode("utf-8")
+
+    return stream_header(Response(generate(), mimetype="text/plain"))
+
+
+@blueprint.route(f"{URL_PREFIX}/tile", methods=["GET"])
+async def api_tile():
+    token = request.args.get("token", "")
+
+    if token not in generator.panel_data_map:
+        return f"Invalid token: {token}"
+
+    tile_queue = generator.panel_data_map[token]["tile"]
+
+    async def generate():
+        async for tile in stream_queue(tile_queue):
+            yield f"event: panel\ndata: {json.dumps(tile)}\n\n"
+
+        yield "event: done\ndata: \n\n"
+
+    return stream_header(Response(generate(), mimetype="text/event-stream"))
+
+
+@blueprint.route(f"{URL_PREFIX}/run", methods=["GET"])
+async def api_run():
+    is_small_mode = request.args.get("mode", "") == "small"
+    is_test_mode = request.args.get("test", False, type=bool)
+    callback = request.args.get("callback", False)
+
+    config_file = generator.get_config_file(current_app.config, is_small_mode)
+    is_dummy_mode = current_app.config["DUMMY_MODE"]
+
+    try:
+        token = generator.generate_image(config_file, is_small_mode, is_dummy_mode, is_test_mode)
+        result = {"token": token}
+    except Exception:
+        result = {"token": "", "error": traceback.format_exc()}
+
+    # NOTE: my_lib.flask_util.support_jsonp は Flask 専用なので，ここで JSONP に対応する
+    if callback:
+        return Response(f"{callback}({json.dumps(result)})", mimetype="application/javascript")
+
+    return jsonify(result)
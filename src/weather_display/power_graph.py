@@ -14,7 +14,6 @@ import datetime
 import io
 import logging
 import os
-import pathlib
 import time
 import traceback
 
@@ -27,6 +26,7 @@ import matplotlib.dates as mdates
 import matplotlib.font_manager
 import matplotlib.pyplot as plt
 import my_lib.panel_util
+import weather_display.font_util
 from my_lib.sensor_data import fetch_data
 from pandas.plotting import register_matplotlib_converters
 
@@ -35,21 +35,13 @@ register_matplotlib_converters()
 IMAGE_DPI = 100.0
 
 
-def get_plot_font(config, font_type, size):
-    font_path = pathlib.Path(config["path"]).resolve() / config["map"][font_type]
-
-    logging.info("Load font: %s", font_path)
-
-    return mpl.font_manager.FontProperties(fname=font_path, size=size)
-
-
 def get_face_map(font_config):
     return {
-        "title": get_plot_font(font_config, "jp_bold", 60),
-        "value": get_plot_font(font_config, "en_cond_bold", 80),
-        "value_unit": get_plot_font(font_config, "jp_regular", 18),
-        "axis_minor": get_plot_font(font_config, "jp_regular", 26),
-        "axis_major": get_plot_font(font_config, "jp_regular", 32),
+        "title": weather_display.font_util.get_plot_font(font_config, "jp_bold", 60),
+        "value": weather_display.font_util.get_plot_font(font_config, "en_cond_bold", 80),
+        "value_unit": weather_display.font_util.get_plot_font(font_config, "jp_regular", 18),
+        "axis_minor": weather_display.font_util.get_plot_font(font_config, "jp_regular", 26),
+        "axis_major": weather_display.font_util.get_plot_font(font_config, "jp_regular", 32),
     }
 
 
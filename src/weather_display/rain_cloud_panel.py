@@ -10,11 +10,18 @@ Options:
   -o PNG_FILE  : 生成した画像を指定されたパスに保存します．
 """
 
+import datetime
+import functools
+import hashlib
 import io
 import logging
+import math
 import pathlib
+import pickle
+import threading
 import time
 import traceback
+import urllib.parse
 from concurrent import futures
 
 import cv2
@@ -25,17 +32,105 @@ import my_lib.thread_util
 import numpy as np
 import PIL.Image
 import PIL.ImageDraw
+import requests
+import requests.adapters
 import selenium.webdriver.common.by
 import selenium.webdriver.support
 import selenium.webdriver.support.wait
+import weather_display.file_util
+import weather_display.font_util
 from my_lib.selenium_util import click_xpath  # NOTE: テスト時に mock する
 
 DATA_PATH = pathlib.Path("data")
 WINDOW_SIZE_CACHE = DATA_PATH / "window_size.cache"
-CACHE_EXPIRE_HOUR = 1
+
+# NOTE: 雨雲画像は観測時刻ごとにキャッシュし，古いものは削除する
+CLOUD_CACHE_PATH = DATA_PATH / "rain_cloud"
+CLOUD_CACHE_EXPIRE_HOUR = 3
+# NOTE: キャッシュする内容を変えた場合は更新する
+CLOUD_CACHE_FORMAT = 3
+
+# NOTE: 降雨量の集計結果．他のパネル等から参照する
+RAINFALL_FILE = DATA_PATH / "rainfall.json"
+# NOTE: 集計する範囲 (5km の同心円の半径)
+RAINFALL_AREA_RADIUS = 164
+# NOTE: 最も強い区分 (80mm/h 以上) には上限が無いので，一つ下の区分 (80mm/h) と
+# 区別できるようにこの値として扱う
+RAINFALL_INTENSITY_MAX = 100
+# NOTE: 集計結果の雨量は各区分の上限値に基づくので，平均値等は実際より大きめになる
+RAINFALL_BASIS = "class_upper_bound"
+
+# NOTE: 予報の各時刻の降雨量の推移．他のパネル等から参照する
+NOWCAST_FILE = DATA_PATH / "nowcast.json"
+# NOTE: 予報を取得する間隔 [分] (気象庁の予報は 5 分刻み)
+NOWCAST_STEP_MIN_LIST = [5, 10]
+NOWCAST_STEP_MIN = 10
 
 CLOUD_IMAGE_XPATH = '//div[contains(@id, "jmatile_map_")]'
 
+# NOTE: 表示中のタイルが全て読み込み済み (フェードイン完了) であれば，タイル数と要素のサイズを返す
+SCRIPT_TILE_STATE = """
+var element = document.evaluate(
+    arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+).singleNodeValue;
+if ((element === null) || (element.querySelector(".leaflet-zoom-anim") !== null)) {
+    return null;
+}
+var tiles = element.querySelectorAll("img.leaflet-tile");
+for (var i = 0; i < tiles.length; i++) {
+    if (!tiles[i].complete || ((tiles[i].style.opacity !== "") && (tiles[i].style.opacity !== "1"))) {
+        return null;
+    }
+}
+var rect = element.getBoundingClientRect();
+return [tiles.length, rect.width, rect.height];
+"""
+# NOTE: 表示中のタイルの URL の一覧 (表示する時刻を切り替えると変化する)
+SCRIPT_TILE_SRC = """
+var element = document.evaluate(
+    arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+).singleNodeValue;
+if (element === null) {
+    return null;
+}
+return Array.from(element.querySelectorAll("img.leaflet-tile"), (tile) => tile.src).sort();
+"""
+TILE_LOAD_TIMEOUT = 10
+TILE_LOAD_POLL_SEC = 0.1
+
+# NOTE: タイルエンジンの設定
+TILE_SIZE = 256
+TILE_FETCH_WORKERS = 8
+TILE_FETCH_TIMEOUT = 10
+TIME_FORMAT = "%Y%m%d%H%M%S"
+FUTURE_OFFSET = datetime.timedelta(hours=1)
+# NOTE: 観測時刻は 5 分毎にしか更新されないので，問い合わせ結果を短時間使い回す
+BASETIME_CACHE_SEC = 30
+
+# NOTE: ブラウザを使い回す場合に，作り直すまでの利用回数と経過時間
+DRIVER_RECYCLE_COUNT = 100
+DRIVER_RECYCLE_SEC = 6 * 60 * 60
+# NOTE: ブラウザを起動する際に，１時間後の方の起動をずらす時間
+DRIVER_STAGGER_SEC = 5
+
+http_session = None
+http_session_lock = threading.Lock()
+
+basetime_cache = {}
+basetime_cache_lock = threading.Lock()
+
+window_size_cache_lock = threading.Lock()
+
+overlay_cache = {}
+overlay_cache_lock = threading.Lock()
+
+nowcast_cache = {}
+nowcast_cache_lock = threading.Lock()
+
+is_keep_driver = False
+driver_map = {}
+driver_lock = threading.Lock()
+
 RAINFALL_INTENSITY_LEVEL = [
     # NOTE: 白
     {"func": lambda h, s: (160 < h) & (h < 180) & (s < 20), "value": 1},  # noqa: SIM300
@@ -58,9 +153,9 @@ RAINFALL_INTENSITY_LEVEL = [
 
 def get_face_map(font_config):
     return {
-        "title": my_lib.pil_util.get_font(font_config, "jp_medium", 50),
-        "legend": my_lib.pil_util.get_font(font_config, "en_medium", 30),
-        "legend_unit": my_lib.pil_util.get_font(font_config, "en_medium", 18),
+        "title": weather_display.font_util.get_font(font_config, "jp_medium", 50),
+        "legend": weather_display.font_util.get_font(font_config, "en_medium", 30),
+        "legend_unit": weather_display.font_util.get_font(font_config, "en_medium", 18),
     }
 
 
@@ -125,31 +220,126 @@ def change_setting(driver, wait):
     )
 
 
+def show_future(driver, wait):
+    click_xpath(
+        driver,
+        '//div[@class="jmatile-control"]//div[contains(text(), " +1時間 ")]',
+        wait,
+        True,
+    )
+
+
 def shape_cloud_display(driver, wait, width, height, is_future):  # noqa: ARG001
     if is_future:
-        click_xpath(
-            driver,
-            '//div[@class="jmatile-control"]//div[contains(text(), " +1時間 ")]',
-            wait,
-            True,
-        )
+        show_future(driver, wait)
 
     change_setting(driver, wait)
     hide_label_and_icon(driver, wait)
 
 
+def wait_tile_loaded(driver):
+    # NOTE: タイルの読み込みが完了し，レイアウトが変化しなくなるまで待つ
+    state = {"last": None}
+
+    def is_stable(driver):
+        current = driver.execute_script(SCRIPT_TILE_STATE, CLOUD_IMAGE_XPATH)
+        is_ready = (current is not None) and (current == state["last"])
+        state["last"] = current
+
+        return is_ready
+
+    selenium.webdriver.support.wait.WebDriverWait(
+        driver, TILE_LOAD_TIMEOUT, poll_frequency=TILE_LOAD_POLL_SEC
+    ).until(is_stable, "Timeout while loading tiles")
+
+
+def get_tile_src(driver):
+    return driver.execute_script(SCRIPT_TILE_SRC, CLOUD_IMAGE_XPATH)
+
+
+def wait_tile_changed(driver, tile_src):
+    # NOTE: 切り替え前のタイルも読み込み済みで安定しているので，先にタイルが入れ替わるのを待つ
+    selenium.webdriver.support.wait.WebDriverWait(
+        driver, TILE_LOAD_TIMEOUT, poll_frequency=TILE_LOAD_POLL_SEC
+    ).until(
+        lambda driver: get_tile_src(driver) not in [None, tile_src],
+        "Timeout while switching tiles",
+    )
+
+
+def get_element_size(driver):
+    return driver.find_element(selenium.webdriver.common.by.By.XPATH, CLOUD_IMAGE_XPATH).size
+
+
+def is_element_size_match(driver, width, height):
+    element_size = get_element_size(driver)
+
+    return (element_size["width"], element_size["height"]) == (width, height)
+
+
+def get_window_size_key(driver, width, height):
+    # NOTE: Chrome のバージョンが変わると，ウィンドウ枠のサイズが変わる可能性がある
+    return (width, height, driver.capabilities.get("browserVersion", ""))
+
+
+def load_window_size_cache():
+    if not WINDOW_SIZE_CACHE.exists():
+        return {}
+
+    # NOTE: ウィンドウ枠のサイズは Chrome のバージョンごとに変わらないので，期限は設けない．
+    # 合わなくなった場合は change_window_size で調整し直す．
+    try:
+        with WINDOW_SIZE_CACHE.open("rb") as f:
+            return pickle.load(f)  # noqa: S301
+    except Exception:
+        logging.warning("Failed to load window size cache")
+        return {}
+
+
+def save_window_size_cache(key, window_size):
+    with window_size_cache_lock:
+        window_size_cache = load_window_size_cache()
+        window_size_cache[key] = window_size
+
+        weather_display.file_util.write_atomic(WINDOW_SIZE_CACHE, lambda f: pickle.dump(window_size_cache, f))
+
+
 def change_window_size(driver, width, height):
+    # NOTE: ブラウザを使い回している場合は，既にサイズが合っている
+    if is_element_size_match(driver, width, height):
+        return driver.get_window_size()
+
+    key = get_window_size_key(driver, width, height)
+    window_size = load_window_size_cache().get(key)
+
+    if window_size is not None:
+        logging.info("[cache] window: %d x %d", window_size["width"], window_size["height"])
+        driver.set_window_size(window_size["width"], window_size["height"])
+
+        if is_element_size_match(driver, width, height):
+            return driver.get_window_size()
+
+        logging.info("Cached window size is unmatch, calibrate again")
+
+    window_size = calibrate_window_size(driver, width, height)
+    if is_element_size_match(driver, width, height):
+        save_window_size_cache(key, window_size)
+
+    return window_size
+
+
+def calibrate_window_size(driver, width, height):
     # NOTE: 雨雲画像がこのサイズになるように，ウィンドウサイズを調整する
     logging.info("target: %d x %d", width, height)
 
     # NOTE: まずはサイズを大きめにしておく
     driver.set_window_size(int(height * 2), int(height * 1.5))
 
-    time.sleep(1)
+    wait_tile_loaded(driver)
 
     # NOTE: 最初に横サイズを調整
     window_size = driver.get_window_size()
-    element_size = driver.find_element(selenium.webdriver.common.by.By.XPATH, CLOUD_IMAGE_XPATH).size
+    element_size = get_element_size(driver)
     logging.info(
         "[actual] window: %d x %d, element: %d x %d",
         window_size["width"],
@@ -162,11 +352,11 @@ def change_window_size(driver, width, height):
         target_window_width = window_size["width"] + (width - element_size["width"])
         logging.info("[change] window: %d x %d", target_window_width, window_size["height"])
         driver.set_window_size(target_window_width, height)
-        time.sleep(1)
+        wait_tile_loaded(driver)
 
     # NOTE: 次に縦サイズを調整
     window_size = driver.get_window_size()
-    element_size = driver.find_element(selenium.webdriver.common.by.By.XPATH, CLOUD_IMAGE_XPATH).size
+    element_size = get_element_size(driver)
     logging.info(
         "[actual] window: %d x %d, element: %d x %d",
         window_size["width"],
@@ -181,10 +371,10 @@ def change_window_size(driver, width, height):
             window_size["width"],
             target_window_height,
         )
-        time.sleep(1)
+        wait_tile_loaded(driver)
 
     window_size = driver.get_window_size()
-    element_size = driver.find_element(selenium.webdriver.common.by.By.XPATH, CLOUD_IMAGE_XPATH).size
+    element_size = get_element_size(driver)
     logging.info(
         "[actual] window: %d x %d, element: %d x %d",
         window_size["width"],
@@ -200,9 +390,7 @@ def change_window_size(driver, width, height):
     return driver.get_window_size()
 
 
-def fetch_cloud_image(driver, wait, url, width, height, is_future=False):  # noqa: PLR0913
-    logging.info("fetch cloud image")
-
+def load_cloud_page(driver, wait, url, width, height):
     driver.get(url)
 
     wait.until(
@@ -212,61 +400,411 @@ def fetch_cloud_image(driver, wait, url, width, height, is_future=False):  # noq
     )
 
     change_window_size(driver, width, height)
-    shape_cloud_display(driver, wait, width, height, is_future)
 
+
+def capture_cloud_image(driver, wait):
     wait.until(lambda driver: driver.execute_script("return document.readyState") == "complete")
-    time.sleep(0.5)
+    wait_tile_loaded(driver)
+
+    return driver.find_element(selenium.webdriver.common.by.By.XPATH, CLOUD_IMAGE_XPATH).screenshot_as_png
+
+
+def fetch_cloud_image(driver, wait, url, width, height, is_future=False):  # noqa: PLR0913
+    logging.info("fetch cloud image")
+
+    load_cloud_page(driver, wait, url, width, height)
+    shape_cloud_display(driver, wait, width, height, is_future)
 
-    png_data = driver.find_element(selenium.webdriver.common.by.By.XPATH, CLOUD_IMAGE_XPATH).screenshot_as_png
+    png_data = capture_cloud_image(driver, wait)
 
     driver.refresh()
 
     return png_data
 
 
-def retouch_cloud_image(png_data, panel_config):
-    logging.info("retouch image")
+def fetch_cloud_image_pair(driver, wait, url, width, height):
+    logging.info("fetch cloud image (current and future)")
 
-    img_rgb = cv2.imdecode(np.asarray(bytearray(png_data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    # NOTE: 一度設定したページで，現在の画像を撮った後に時刻を進めて１時間後の画像を撮る
+    load_cloud_page(driver, wait, url, width, height)
+    shape_cloud_display(driver, wait, width, height, False)
 
-    img_hsv = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2HSV_FULL).astype(np.float32)
-    bar = np.zeros((1, len(RAINFALL_INTENSITY_LEVEL), 3))
-    h, s, v = cv2.split(img_hsv)
+    png_data_list = [capture_cloud_image(driver, wait)]
 
-    # NOTE: 降雨強度の色をグレースケール用に変換
-    for i, level in enumerate(RAINFALL_INTENSITY_LEVEL):
-        color = (
-            0,
-            80,
-            255
-            * (
-                (float(len(RAINFALL_INTENSITY_LEVEL) - i) / len(RAINFALL_INTENSITY_LEVEL))
-                ** panel_config["legend"]["gamma"]
-            ),
-        )
+    tile_src = get_tile_src(driver)
+    show_future(driver, wait)
+    wait_tile_changed(driver, tile_src)
+    png_data_list.append(capture_cloud_image(driver, wait))
 
-        img_hsv[level["func"](h, s)] = color
-        bar[0][i] = color
+    driver.refresh()
 
-    # NOTE: 白地図の色をやや明るめにする
-    img_hsv[s < 30, 2] = np.clip(pow(v[(s < 30)], 1.35) * 0.3, 0, 255)
+    return png_data_list
+
+
+def get_http_session():
+    global http_session  # noqa: PLW0603
+
+    # NOTE: タイルの取得では同じホストに何度もアクセスするので，接続を使い回す
+    with http_session_lock:
+        if http_session is None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=TILE_FETCH_WORKERS, pool_maxsize=TILE_FETCH_WORKERS, max_retries=2
+            )
+            http_session = requests.Session()
+            http_session.mount("http://", adapter)
+            http_session.mount("https://", adapter)
+
+        return http_session
+
+
+def parse_map_param(url):
+    # NOTE: https://www.jma.go.jp/bosai/nowc/#zoom:12/lat:35.682677/lon:139.762230/... から位置を取り出す
+    param = dict(item.split(":", 1) for item in urllib.parse.urlparse(url).fragment.split("/") if ":" in item)
+
+    return {"zoom": int(param["zoom"]), "lat": float(param["lat"]), "lon": float(param["lon"])}
+
+
+def latlon_to_pixel(lat, lon, zoom):
+    # NOTE: Web メルカトル図法での，指定ズームレベルにおけるピクセル座標
+    scale = TILE_SIZE * (2**zoom)
+    lat_rad = math.radians(lat)
 
     return (
-        PIL.Image.fromarray(
-            cv2.cvtColor(
-                cv2.cvtColor(img_hsv.astype(np.uint8), cv2.COLOR_HSV2RGB_FULL),
-                cv2.COLOR_RGB2RGBA,
+        (lon + 180.0) / 360.0 * scale,
+        (1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * scale,
+    )
+
+
+def fetch_basetime(target_time_config):
+    url = target_time_config["current"]
+
+    with basetime_cache_lock:
+        if (url in basetime_cache) and ((time.time() - basetime_cache[url]["time"]) < BASETIME_CACHE_SEC):
+            return basetime_cache[url]["basetime"]
+
+    res = get_http_session().get(url, timeout=TILE_FETCH_TIMEOUT)
+    res.raise_for_status()
+
+    basetime = max(target["basetime"] for target in res.json())
+    with basetime_cache_lock:
+        basetime_cache[url] = {"basetime": basetime, "time": time.time()}
+
+    return basetime
+
+
+def fetch_target_time(target_time_config, basetime, is_future):
+    if not is_future:
+        return {"basetime": basetime, "validtime": basetime}
+
+    validtime = (datetime.datetime.strptime(basetime, TIME_FORMAT) + FUTURE_OFFSET).strftime(TIME_FORMAT)
+
+    res = get_http_session().get(target_time_config["future"], timeout=TILE_FETCH_TIMEOUT)
+    res.raise_for_status()
+    if not any(
+        (target["basetime"] == basetime) and (target["validtime"] == validtime) for target in res.json()
+    ):
+        raise RuntimeError(f"予報の時刻が見つかりません．(basetime: {basetime}, validtime: {validtime})")
+
+    return {"basetime": basetime, "validtime": validtime}
+
+
+def fetch_tile(url, is_optional):
+    res = get_http_session().get(url, timeout=TILE_FETCH_TIMEOUT)
+
+    # NOTE: 雨雲のタイルはデータが無い場合があるので，その場合は透明として扱う
+    if is_optional and (res.status_code == 404):
+        return None
+    res.raise_for_status()
+
+    return np.asarray(PIL.Image.open(io.BytesIO(res.content)).convert("RGBA"))
+
+
+def submit_tile_image(executor, url_template, center, zoom, size, is_optional=False, **param):  # noqa: PLR0913
+    # NOTE: ズームレベル zoom で center を中心とする size の領域を覆うタイルの取得を開始する．
+    # タイルが提供されるズームレベルより大きい場合は，低いズームレベルのタイルを拡大して使う．
+    tile_zoom = min(zoom, url_template.get("zoom_max", zoom))
+    scale = 2 ** (zoom - tile_zoom)
+
+    left = round(center[0] - size[0] / 2)
+    top = round(center[1] - size[1] / 2)
+    region = (left // scale, top // scale, (left + size[0] - 1) // scale, (top + size[1] - 1) // scale)
+
+    tile_x_list = range(region[0] // TILE_SIZE, region[2] // TILE_SIZE + 1)
+    tile_y_list = range(region[1] // TILE_SIZE, region[3] // TILE_SIZE + 1)
+
+    return {
+        "task": {
+            (tile_x, tile_y): executor.submit(
+                fetch_tile,
+                url_template["url"].format(z=tile_zoom, x=tile_x % (2**tile_zoom), y=tile_y, **param),
+                is_optional,
             )
-        ),
-        PIL.Image.fromarray(
-            cv2.cvtColor(
-                cv2.cvtColor(bar.astype(np.uint8), cv2.COLOR_HSV2RGB_FULL),
-                cv2.COLOR_RGB2RGBA,
+            for tile_x in tile_x_list
+            for tile_y in tile_y_list
+        },
+        "origin": (tile_x_list[0], tile_y_list[0]),
+        "count": (len(tile_x_list), len(tile_y_list)),
+        "region": region,
+        "offset": (left - region[0] * scale, top - region[1] * scale),
+        "scale": scale,
+        "size": size,
+    }
+
+
+def assemble_tile_image(tile_image):
+    origin = tile_image["origin"]
+    canvas = np.zeros(
+        (tile_image["count"][1] * TILE_SIZE, tile_image["count"][0] * TILE_SIZE, 4),
+        dtype=np.uint8,
+    )
+
+    for (tile_x, tile_y), task in tile_image["task"].items():
+        tile = task.result()
+        if tile is None:
+            continue
+        pos_x = (tile_x - origin[0]) * TILE_SIZE
+        pos_y = (tile_y - origin[1]) * TILE_SIZE
+        canvas[pos_y : pos_y + TILE_SIZE, pos_x : pos_x + TILE_SIZE] = tile
+
+    region = tile_image["region"]
+    canvas = canvas[
+        region[1] - origin[1] * TILE_SIZE : region[3] - origin[1] * TILE_SIZE + 1,
+        region[0] - origin[0] * TILE_SIZE : region[2] - origin[0] * TILE_SIZE + 1,
+    ]
+    if tile_image["scale"] != 1:
+        canvas = canvas.repeat(tile_image["scale"], axis=0).repeat(tile_image["scale"], axis=1)
+
+    offset = tile_image["offset"]
+    size = tile_image["size"]
+
+    return canvas[offset[1] : offset[1] + size[1], offset[0] : offset[0] + size[0]]
+
+
+def fetch_cloud_image_tile(url, tile_config, width, height, target_time):
+    return fetch_cloud_image_tile_list(url, tile_config, width, height, [target_time])[0]
+
+
+def fetch_cloud_image_tile_list(url, tile_config, width, height, target_time_list):
+    logging.info("fetch cloud image (tile, %d frames)", len(target_time_list))
+
+    map_param = parse_map_param(url)
+    center = latlon_to_pixel(map_param["lat"], map_param["lon"], map_param["zoom"])
+
+    # NOTE: 地図は全時刻で共通なので一度だけ取得し，雨雲のタイルは全時刻分をまとめて取得する
+    with futures.ThreadPoolExecutor(TILE_FETCH_WORKERS) as executor:
+        base_image = submit_tile_image(
+            executor, tile_config["base"], center, map_param["zoom"], (width, height)
+        )
+        cloud_image_list = [
+            submit_tile_image(
+                executor,
+                tile_config["cloud"],
+                center,
+                map_param["zoom"],
+                (width, height),
+                True,
+                **target_time,
             )
-        ),
+            for target_time in target_time_list
+        ]
+
+        base = assemble_tile_image(base_image)[:, :, :3].astype(np.uint16)
+        cloud = np.stack([assemble_tile_image(cloud_image) for cloud_image in cloud_image_list])
+
+    # NOTE: 地図の上に雨雲を重ねる
+    alpha = cloud[:, :, :, 3:].astype(np.uint16)
+    img = ((base * (255 - alpha) + cloud[:, :, :, :3] * alpha + 127) // 255).astype(np.uint8)
+
+    return np.ascontiguousarray(img[:, :, :, ::-1])
+
+
+def decode_cloud_image(png_data):
+    return cv2.imdecode(np.asarray(bytearray(png_data), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+@functools.lru_cache(maxsize=None)
+def get_hs_lut():
+    # NOTE: (h, s) ごとに，変換後の (h, s) と明度の変換方法 (get_value_lut の行) を求めておく．
+    # 行は 0〜N-1 が降雨強度，N が変換なし，N+1 が白地図の明るさ調整．
+    h, s = np.meshgrid(np.arange(256, dtype=np.float32), np.arange(256, dtype=np.float32), indexing="ij")
+
+    level_lut = np.full((256, 256), len(RAINFALL_INTENSITY_LEVEL), dtype=np.uint8)
+    for i, level in enumerate(RAINFALL_INTENSITY_LEVEL):
+        level_lut[level["func"](h, s)] = i
+
+    is_level = level_lut != len(RAINFALL_INTENSITY_LEVEL)
+
+    hs_lut = np.empty((256, 256, 2), dtype=np.uint8)
+    hs_lut[:, :, 0] = np.where(is_level, 0, h)
+    hs_lut[:, :, 1] = np.where(is_level, 80, s)
+
+    row_lut = np.where(s < 30, len(RAINFALL_INTENSITY_LEVEL) + 1, level_lut).astype(np.uint8)
+
+    return (hs_lut.reshape(-1, 2), row_lut.reshape(-1), level_lut.reshape(-1))
+
+
+@functools.lru_cache(maxsize=None)
+def get_intensity_lut():
+    # NOTE: 降雨強度の区分ごとの雨量 [mm/h]．区分の上限値とし，区分外は 0 とする．
+    return np.array(
+        [level.get("value", RAINFALL_INTENSITY_MAX) for level in RAINFALL_INTENSITY_LEVEL] + [0],
+        dtype=np.uint8,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_area_mask(height, width):
+    y, x = np.ogrid[:height, :width]
+
+    return ((x + 0.5 - width / 2) ** 2 + (y + 0.5 - height / 2) ** 2) <= RAINFALL_AREA_RADIUS**2
+
+
+def calc_rainfall(rainfall_grid):
+    area = rainfall_grid[get_area_mask(*rainfall_grid.shape)]
+
+    return {
+        "max": int(area.max()),
+        "mean": float(area.mean()),
+        "coverage": float(np.count_nonzero(area) * 100 / area.size),
+    }
+
+
+def save_rainfall_summary(path, summary):
+    weather_display.file_util.save_json(
+        path,
+        {
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "basis": RAINFALL_BASIS,
+            **summary,
+        },
+    )
+
+
+def save_rainfall(rainfall_map):
+    save_rainfall_summary(RAINFALL_FILE, rainfall_map)
+
+
+def load_rainfall():
+    return weather_display.file_util.load_json(RAINFALL_FILE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_value_lut(gamma):
+    value_lut = np.empty((len(RAINFALL_INTENSITY_LEVEL) + 2, 256), dtype=np.uint8)
+
+    for i in range(len(RAINFALL_INTENSITY_LEVEL)):
+        value_lut[i] = 255 * (
+            (float(len(RAINFALL_INTENSITY_LEVEL) - i) / len(RAINFALL_INTENSITY_LEVEL)) ** gamma
+        )
+
+    v = np.arange(256, dtype=np.float32)
+    value_lut[len(RAINFALL_INTENSITY_LEVEL)] = v
+    # NOTE: 白地図の色をやや明るめにする
+    value_lut[len(RAINFALL_INTENSITY_LEVEL) + 1] = np.clip(pow(v, 1.35) * 0.3, 0, 255)
+
+    return value_lut.reshape(-1)
+
+
+def classify_cloud_image(img_rgb, gamma):
+    hs_lut, row_lut, level_lut = get_hs_lut()
+    value_lut = get_value_lut(gamma)
+
+    img_hsv = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2HSV_FULL)
+    hs_index = (img_hsv[:, :, 0].astype(np.uint16) << 8) | img_hsv[:, :, 1]
+
+    # NOTE: 色から降雨強度 [mm/h] を求める
+    rainfall_grid = get_intensity_lut()[level_lut[hs_index]]
+
+    # NOTE: 降雨強度の色をグレースケール用に変換
+    img_hsv[:, :, :2] = hs_lut[hs_index]
+    img_hsv[:, :, 2] = value_lut[(row_lut[hs_index].astype(np.uint16) << 8) | img_hsv[:, :, 2]]
+
+    return (cv2.cvtColor(cv2.cvtColor(img_hsv, cv2.COLOR_HSV2RGB_FULL), cv2.COLOR_RGB2RGBA), rainfall_grid)
+
+
+def create_legend_bar(gamma):
+    value_lut = get_value_lut(gamma)
+
+    bar = np.zeros((1, len(RAINFALL_INTENSITY_LEVEL), 3), dtype=np.uint8)
+    bar[0, :, 1] = 80
+    bar[0, :, 2] = value_lut[np.arange(len(RAINFALL_INTENSITY_LEVEL)) << 8]
+
+    return PIL.Image.fromarray(
+        cv2.cvtColor(
+            cv2.cvtColor(bar, cv2.COLOR_HSV2RGB_FULL),
+            cv2.COLOR_RGB2RGBA,
+        )
+    )
+
+
+def retouch_cloud_image(img_rgb, panel_config):
+    logging.info("retouch image")
+
+    img_rgba, rainfall_grid = classify_cloud_image(img_rgb, panel_config["legend"]["gamma"])
+
+    return (
+        PIL.Image.fromarray(img_rgba),
+        create_legend_bar(panel_config["legend"]["gamma"]),
+        rainfall_grid,
+    )
+
+
+def retouch_cloud_image_list(img_rgb_list, panel_config):
+    logging.info("retouch image (%d frames)", len(img_rgb_list))
+
+    # NOTE: 全フレームを縦に繋げた１枚の画像として，まとめて変換する
+    count, height, width = img_rgb_list.shape[:3]
+    img_rgba, rainfall_grid = classify_cloud_image(
+        np.ascontiguousarray(img_rgb_list).reshape(count * height, width, 3), panel_config["legend"]["gamma"]
+    )
+
+    return (
+        [PIL.Image.fromarray(img) for img in img_rgba.reshape(count, height, width, 4)],
+        rainfall_grid.reshape(count, height, width),
     )
 
 
+def create_overlay(layer, offset=(0, 0)):
+    # NOTE: 透明な背景に描画したレイヤーを，描画された範囲だけ切り出しておく
+    bbox = layer.getchannel("A").getbbox()
+    if bbox is None:
+        return None
+
+    return {"offset": (offset[0] + bbox[0], offset[1] + bbox[1]), "image": layer.crop(bbox)}
+
+
+def get_overlay(key, create_func, *args):
+    with overlay_cache_lock:
+        if key in overlay_cache:
+            return overlay_cache[key]
+
+    overlay = create_func(*args)
+
+    with overlay_cache_lock:
+        overlay_cache[key] = overlay
+
+    return overlay
+
+
+def blend_overlay(img, overlay_list):
+    # NOTE: 描画済みのレイヤーを，該当する範囲にだけ直接合成する
+    for overlay in overlay_list:
+        if overlay is None:
+            continue
+
+        img.alpha_composite(overlay["image"], overlay["offset"])
+
+    return img
+
+
+def create_circle_overlay(size):
+    return create_overlay(draw_equidistant_circle(PIL.Image.new("RGBA", size, (255, 255, 255, 0))))
+
+
+def create_caption_overlay(size, title, face_map):
+    return create_overlay(draw_caption(PIL.Image.new("RGBA", size, (255, 255, 255, 0)), title, face_map))
+
+
 def draw_equidistant_circle(img):
     logging.info("draw equidistant_circle")
     draw = PIL.ImageDraw.Draw(img)
@@ -281,7 +819,7 @@ def draw_equidistant_circle(img):
         width=5,
     )
     # 5km
-    size = 328
+    size = RAINFALL_AREA_RADIUS * 2
     draw.ellipse(
         (x - size / 2, y - size / 2, x + size / 2, y + size / 2),
         outline=(255, 255, 255),
@@ -299,7 +837,7 @@ def draw_equidistant_circle(img):
 
 def draw_caption(img, title, face_map):
     logging.info("draw caption")
-    caption_size = my_lib.pil_util.text_size(img, face_map["title"], title)
+    caption_size = weather_display.font_util.text_size(face_map["title"], title)
     caption_size = (caption_size[0] + 5, caption_size[1])  # NOTE: 横方向を少し広げる
 
     x = 12
@@ -334,43 +872,396 @@ def draw_caption(img, title, face_map):
         fill=(255, 255, 255, alpha),
         radius=radius,
     )
-    img = PIL.Image.alpha_composite(img, overlay)
+    # NOTE: 文字は透明な黒地に描いてから重ねる．こうすると，背景が透明なレイヤーに描いて
+    # 後から合成した場合でも，直接描いた場合と同じ結果になる．
+    text = PIL.Image.new("RGBA", img.size, (0, 0, 0, 0))
     my_lib.pil_util.draw_text(
-        img,
+        text,
         title,
         (10, 10),
         face_map["title"],
         "left",
         color="#000",
     )
+    overlay.alpha_composite(text)
 
-    return img
+    return PIL.Image.alpha_composite(img, overlay)
+
+
+def is_tile_engine(panel_config):
+    return panel_config["data"]["jma"].get("engine", "selenium") == "tile"
+
+
+def is_single_page(panel_config):
+    return (not is_tile_engine(panel_config)) and panel_config["data"]["jma"].get("single_page", False)
+
+
+def get_basetime(panel_config):
+    # NOTE: タイルエンジンでは観測時刻が必須だが，ブラウザを使う場合はキャッシュに使うだけ
+    if is_tile_engine(panel_config):
+        return fetch_basetime(panel_config["data"]["jma"]["target_time"])
+
+    if "target_time" not in panel_config["data"]["jma"]:
+        return None
+
+    try:
+        return fetch_basetime(panel_config["data"]["jma"]["target_time"])
+    except Exception:
+        logging.warning("Failed to fetch target time")
+        return None
+
+
+def get_cloud_cache_path(panel_config, sub_panel_config, basetime):
+    digest = hashlib.sha256(
+        repr(
+            (
+                panel_config["data"]["jma"]["url"],
+                panel_config["data"]["jma"].get("engine", "selenium"),
+                sub_panel_config["is_future"],
+                sub_panel_config["width"],
+                sub_panel_config["height"],
+                panel_config["legend"]["gamma"],
+                CLOUD_CACHE_FORMAT,
+            )
+        ).encode()
+    ).hexdigest()[:16]
+
+    return CLOUD_CACHE_PATH / f"{basetime}_{digest}.pickle"
+
+
+def load_cloud_cache(panel_config, sub_panel_config, basetime):
+    if basetime is None:
+        return None
+
+    cache_path = get_cloud_cache_path(panel_config, sub_panel_config, basetime)
+    if not cache_path.exists():
+        return None
+
+    try:
+        with cache_path.open("rb") as f:
+            cloud_img = pickle.load(f)  # noqa: S301
+    except Exception:
+        logging.warning("Failed to load rain cloud cache")
+        return None
+
+    logging.info("Use cached rain cloud image (basetime: %s)", basetime)
+
+    return cloud_img
+
+
+def save_cloud_cache(panel_config, sub_panel_config, basetime, cloud_img):
+    if basetime is None:
+        return
+
+    weather_display.file_util.write_atomic(
+        get_cloud_cache_path(panel_config, sub_panel_config, basetime), lambda f: pickle.dump(cloud_img, f)
+    )
+
+    for old_path in CLOUD_CACHE_PATH.glob("*.pickle"):
+        try:
+            if (time.time() - old_path.stat().st_mtime) > (CLOUD_CACHE_EXPIRE_HOUR * 60 * 60):
+                old_path.unlink()
+        except FileNotFoundError:
+            pass
 
 
 def create_rain_cloud_img(panel_config, sub_panel_config, face_map, slack_config, trial):
     logging.info("create rain cloud image (%s)", "future" if sub_panel_config["is_future"] else "current")
-    # NOTE: 同時アクセスを避ける
-    if sub_panel_config["is_future"]:
-        time.sleep(2)
 
-    driver = my_lib.selenium_util.create_driver(
-        "rain_cloud" + ("_future" if sub_panel_config["is_future"] else ""), DATA_PATH
+    basetime = get_basetime(panel_config)
+    cloud_img = load_cloud_cache(panel_config, sub_panel_config, basetime)
+
+    if cloud_img is None:
+        if is_tile_engine(panel_config):
+            img = fetch_cloud_image_tile(
+                panel_config["data"]["jma"]["url"],
+                panel_config["data"]["jma"]["tile"],
+                sub_panel_config["width"],
+                sub_panel_config["height"],
+                fetch_target_time(
+                    panel_config["data"]["jma"]["target_time"], basetime, sub_panel_config["is_future"]
+                ),
+            )
+        else:
+            img = decode_cloud_image(
+                create_rain_cloud_img_selenium(panel_config, sub_panel_config, slack_config, trial)
+            )
+
+        cloud_img = retouch_cloud_image(img, panel_config)
+        save_cloud_cache(panel_config, sub_panel_config, basetime, cloud_img)
+
+    return decorate_cloud_image(*cloud_img, sub_panel_config, face_map)
+
+
+def decorate_cloud_image(img, bar, rainfall_grid, sub_panel_config, face_map):
+    # NOTE: 同心円とキャプションは毎回同じなので，描画済みのものを重ねる
+    title = sub_panel_config["title"]
+    overlay_list = [
+        get_overlay(("circle", img.size), create_circle_overlay, img.size),
+        get_overlay(
+            ("caption", img.size, title, weather_display.font_util.get_font_key(face_map["title"])),
+            create_caption_overlay,
+            img.size,
+            title,
+            face_map,
+        ),
+    ]
+
+    return (blend_overlay(img, overlay_list), bar, calc_rainfall(rainfall_grid))
+
+
+def create_rain_cloud_img_pair(panel_config, sub_panel_config_list, slack_config, trial):
+    logging.info("create rain cloud image (current and future)")
+
+    basetime = get_basetime(panel_config)
+    cloud_img_list = [
+        load_cloud_cache(panel_config, sub_panel_config, basetime)
+        for sub_panel_config in sub_panel_config_list
+    ]
+    if all(cloud_img is not None for cloud_img in cloud_img_list):
+        return cloud_img_list
+
+    # NOTE: 現在と１時間後のサブパネルは同じサイズ
+    png_data_list = fetch_with_driver(
+        "rain_cloud",
+        False,
+        slack_config,
+        trial,
+        fetch_cloud_image_pair,
+        panel_config["data"]["jma"]["url"],
+        sub_panel_config_list[0]["width"],
+        sub_panel_config_list[0]["height"],
     )
 
-    wait = selenium.webdriver.support.wait.WebDriverWait(driver, 5)
+    cloud_img_list = []
+    for sub_panel_config, png_data in zip(sub_panel_config_list, png_data_list):
+        cloud_img = retouch_cloud_image(decode_cloud_image(png_data), panel_config)
+        save_cloud_cache(panel_config, sub_panel_config, basetime, cloud_img)
+        cloud_img_list.append(cloud_img)
 
-    my_lib.selenium_util.clear_cache(driver)
+    return cloud_img_list
 
-    img = None
-    try:
-        img = fetch_cloud_image(
-            driver,
-            wait,
+
+def fetch_target_time_list(target_time_config, basetime, step_min):
+    res = get_http_session().get(target_time_config["future"], timeout=TILE_FETCH_TIMEOUT)
+    res.raise_for_status()
+
+    validtime_list = sorted({target["validtime"] for target in res.json() if target["basetime"] == basetime})
+
+    return [{"basetime": basetime, "validtime": basetime}] + [
+        {"basetime": basetime, "validtime": validtime}
+        for validtime in validtime_list
+        if (get_nowcast_minute(basetime, validtime) > 0)
+        and (get_nowcast_minute(basetime, validtime) % step_min == 0)
+    ]
+
+
+def get_nowcast_minute(basetime, validtime):
+    return int(
+        (
+            datetime.datetime.strptime(validtime, TIME_FORMAT)
+            - datetime.datetime.strptime(basetime, TIME_FORMAT)
+        ).total_seconds()
+        // 60
+    )
+
+
+def get_nowcast_title(minute):
+    if minute == 0:
+        return "現在"
+
+    return f"{minute}分後".translate(str.maketrans("0123456789", "０１２３４５６７８９"))
+
+
+def save_nowcast(nowcast):
+    save_rainfall_summary(NOWCAST_FILE, nowcast)
+
+
+def load_nowcast():
+    return weather_display.file_util.load_json(NOWCAST_FILE)
+
+
+def is_nowcast_available(panel_config):
+    return ("tile" in panel_config["data"]["jma"]) and ("target_time" in panel_config["data"]["jma"])
+
+
+def create_nowcast_sequence(panel_config, font_config, step_min=NOWCAST_STEP_MIN):
+    global nowcast_cache  # noqa: PLW0603
+
+    if step_min not in NOWCAST_STEP_MIN_LIST:
+        raise ValueError(f"予報の間隔が不正です．(step: {step_min})")
+
+    # NOTE: 横に並べる場合のサブパネルと同じ大きさにする
+    width = int(panel_config["panel"]["width"] / 2)
+    height = panel_config["panel"]["height"]
+
+    basetime = fetch_basetime(panel_config["data"]["jma"]["target_time"])
+    key = (
+        basetime,
+        width,
+        height,
+        step_min,
+        panel_config["data"]["jma"]["url"],
+        panel_config["legend"]["gamma"],
+    )
+
+    with nowcast_cache_lock:
+        if nowcast_cache.get("key") == key:
+            return nowcast_cache["sequence"]
+
+    logging.info("create nowcast sequence (basetime: %s, step: %d)", basetime, step_min)
+
+    target_time_list = fetch_target_time_list(panel_config["data"]["jma"]["target_time"], basetime, step_min)
+
+    # NOTE: 全時刻の画像をまとめて取得し，色の変換と降雨強度の算出も一度に行う
+    cloud_img_list, rainfall_grid = retouch_cloud_image_list(
+        fetch_cloud_image_tile_list(
             panel_config["data"]["jma"]["url"],
-            sub_panel_config["width"],
-            sub_panel_config["height"],
-            sub_panel_config["is_future"],
+            panel_config["data"]["jma"]["tile"],
+            width,
+            height,
+            target_time_list,
+        ),
+        panel_config,
+    )
+
+    face_map = get_face_map(font_config)
+    frame_list = []
+    series = []
+    for target_time, cloud_img, grid in zip(target_time_list, cloud_img_list, rainfall_grid):
+        minute = get_nowcast_minute(basetime, target_time["validtime"])
+        frame, _, rainfall = decorate_cloud_image(
+            cloud_img, None, grid, {"title": get_nowcast_title(minute)}, face_map
         )
+
+        frame_list.append(frame)
+        series.append({"validtime": target_time["validtime"], "minute": minute, **rainfall})
+
+    nowcast = {
+        "basetime": basetime,
+        "step": step_min,
+        "series": series,
+        # NOTE: 同心円の範囲に雨雲がかかる最初の時刻を，雨が降り始める目安とする
+        "arrival": next((rainfall["minute"] for rainfall in series if rainfall["max"] > 0), None),
+    }
+    save_nowcast(nowcast)
+
+    sequence = {**nowcast, "frame": frame_list}
+    with nowcast_cache_lock:
+        nowcast_cache = {"key": key, "sequence": sequence}
+
+    return sequence
+
+
+def keep_driver(is_keep=True):
+    global is_keep_driver  # noqa: PLW0603
+
+    # NOTE: 常駐プロセスから呼ばれる場合は，ブラウザを終了せずに次回以降も使い回す
+    is_keep_driver = is_keep
+
+    if not is_keep:
+        term()
+
+
+def term():
+    with driver_lock:
+        driver_list = [driver_info["driver"] for driver_info in driver_map.values()]
+        driver_map.clear()
+
+    for driver in driver_list:
+        quit_driver(driver)
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        logging.exception("Failed to quit driver")
+
+
+def is_driver_healthy(driver_info):
+    if driver_info["count"] >= DRIVER_RECYCLE_COUNT:
+        logging.info("Recycle driver (count: %d)", driver_info["count"])
+        return False
+    if (time.time() - driver_info["time"]) > DRIVER_RECYCLE_SEC:
+        logging.info("Recycle driver (age: %d sec)", time.time() - driver_info["time"])
+        return False
+
+    try:
+        driver_info["driver"].execute_script("return document.readyState")
+    except Exception:
+        logging.warning("Driver is not responding")
+        return False
+
+    return True
+
+
+def get_driver_profile(profile_name):
+    # NOTE: 使い回すブラウザが user-data-dir をロックし続けるので，都度起動されるプロセスと
+    # プロファイルが衝突しないようにする
+    if is_keep_driver:
+        return profile_name + "_resident"
+    else:
+        return profile_name
+
+
+def acquire_driver(profile_name, is_future):
+    driver_info = None
+    if is_keep_driver:
+        with driver_lock:
+            driver_info = driver_map.pop(profile_name, None)
+
+    if (driver_info is not None) and (not is_driver_healthy(driver_info)):
+        quit_driver(driver_info["driver"])
+        driver_info = None
+
+    if driver_info is None:
+        # NOTE: タイミングをずらさないと，初回起動時 user-data-dir を生成しようとした
+        # タイミングでエラーになる．また，同時アクセスも避ける．
+        if is_future:
+            time.sleep(DRIVER_STAGGER_SEC)
+
+        driver = my_lib.selenium_util.create_driver(get_driver_profile(profile_name), DATA_PATH)
+        my_lib.selenium_util.clear_cache(driver)
+
+        driver_info = {"driver": driver, "time": time.time(), "count": 0}
+
+    driver_info["count"] += 1
+
+    return driver_info
+
+
+def release_driver(profile_name, driver_info, is_error=False):
+    if (not is_keep_driver) or is_error:
+        quit_driver(driver_info["driver"])
+        return
+
+    with driver_lock:
+        driver_map[profile_name] = driver_info
+
+
+def create_rain_cloud_img_selenium(panel_config, sub_panel_config, slack_config, trial):
+    return fetch_with_driver(
+        "rain_cloud" + ("_future" if sub_panel_config["is_future"] else ""),
+        sub_panel_config["is_future"],
+        slack_config,
+        trial,
+        fetch_cloud_image,
+        panel_config["data"]["jma"]["url"],
+        sub_panel_config["width"],
+        sub_panel_config["height"],
+        sub_panel_config["is_future"],
+    )
+
+
+def fetch_with_driver(profile_name, is_future, slack_config, trial, fetch_func, *args):  # noqa: PLR0913
+    driver_info = acquire_driver(profile_name, is_future)
+    driver = driver_info["driver"]
+
+    wait = selenium.webdriver.support.wait.WebDriverWait(driver, 5)
+
+    try:
+        result = fetch_func(driver, wait, *args)
     except Exception:
         if (trial >= 3) and (slack_config is not None):
             my_lib.notify.slack.error_with_image(
@@ -385,23 +1276,38 @@ def create_rain_cloud_img(panel_config, sub_panel_config, face_map, slack_config
                 },
                 interval_min=slack_config["error"]["interval_min"],
             )
-        driver.quit()
+        release_driver(profile_name, driver_info, True)
 
         # NOTE: リトライまでに時間を空けるようにする
         time.sleep(10)
 
         raise
 
-    driver.quit()
-
-    img, bar = retouch_cloud_image(img, panel_config)
-    img = draw_equidistant_circle(img)
-    img = draw_caption(img, sub_panel_config["title"], face_map)
+    release_driver(profile_name, driver_info)
 
-    return (img, bar)
+    return result
 
 
 def draw_legend(img, bar, panel_config, face_map):
+    legend_config = panel_config["legend"]
+    offset = (legend_config["offset_x"], legend_config["offset_y"] - 80)
+
+    overlay = get_overlay(
+        (
+            "legend",
+            tuple(bar.getdata()),
+            legend_config["bar_size"],
+            offset,
+            weather_display.font_util.get_font_key(face_map["legend"]),
+            weather_display.font_util.get_font_key(face_map["legend_unit"]),
+        ),
+        lambda: create_overlay(create_legend(img, bar, panel_config, face_map), offset),
+    )
+
+    return blend_overlay(img, [overlay])
+
+
+def create_legend(img, bar, panel_config, face_map):
     PADDING = 20
 
     bar_size = panel_config["legend"]["bar_size"]
@@ -424,10 +1330,10 @@ def draw_legend(img, bar, panel_config, face_map):
             outline=(20, 20, 20),
         )
 
-    text_height = int(my_lib.pil_util.text_size(img, face_map["legend"], "0")[1])
+    text_height = int(weather_display.font_util.text_size(face_map["legend"], "0")[1])
     unit = "mm/h"
-    unit_width, unit_height = my_lib.pil_util.text_size(img, face_map["legend_unit"], unit)
-    unit_overlap = my_lib.pil_util.text_size(img, face_map["legend_unit"], unit[0])[0]
+    unit_width, unit_height = weather_display.font_util.text_size(face_map["legend_unit"], unit)
+    unit_overlap = weather_display.font_util.text_size(face_map["legend_unit"], unit[0])[0]
     legend = PIL.Image.new(
         "RGBA",
         (
@@ -454,7 +1360,9 @@ def draw_legend(img, bar, panel_config, face_map):
         else:
             text = "mm/h"
             pos_x = PADDING + bar_size * (i + 1) - unit_overlap
-            pos_y = PADDING - 5 + my_lib.pil_util.text_size(img, face_map["legend"], "0")[1] - unit_height
+            pos_y = (
+                PADDING - 5 + weather_display.font_util.text_size(face_map["legend"], "0")[1] - unit_height
+            )
             align = "left"
             font = face_map["legend_unit"]
 
@@ -470,13 +1378,7 @@ def draw_legend(img, bar, panel_config, face_map):
             "#666",
         )
 
-    my_lib.pil_util.alpha_paste(
-        img,
-        legend,
-        (panel_config["legend"]["offset_x"], panel_config["legend"]["offset_y"] - 80),
-    )
-
-    return img
+    return legend
 
 
 def create_rain_cloud_panel_impl(  # noqa: PLR0913
@@ -531,27 +1433,34 @@ def create_rain_cloud_panel_impl(  # noqa: PLR0913
         else my_lib.thread_util.SingleThreadExecutor()
     )
 
-    for sub_panel_config in SUB_PANEL_CONFIG_LIST:
-        task_list.append(
-            executor.submit(
-                create_rain_cloud_img,
-                panel_config,
-                sub_panel_config,
-                face_map,
-                slack_config,
-                trial,
+    if is_single_page(panel_config):
+        cloud_img_list = create_rain_cloud_img_pair(panel_config, SUB_PANEL_CONFIG_LIST, slack_config, trial)
+
+        for sub_panel_config, cloud_img in zip(SUB_PANEL_CONFIG_LIST, cloud_img_list):
+            task_list.append(executor.submit(decorate_cloud_image, *cloud_img, sub_panel_config, face_map))
+    else:
+        for sub_panel_config in SUB_PANEL_CONFIG_LIST:
+            task_list.append(
+                executor.submit(
+                    create_rain_cloud_img,
+                    panel_config,
+                    sub_panel_config,
+                    face_map,
+                    slack_config,
+                    trial,
+                )
             )
-        )
-        # NOTE: タイミングをずらさないと，初回起動時 user-data-dir を生成しようとした
-        # タイミングでエラーになる．
-        time.sleep(3)
 
+    rainfall_map = {}
     for i, sub_panel_config in enumerate(SUB_PANEL_CONFIG_LIST):
-        sub_img, bar = task_list[i].result()
+        sub_img, bar, rainfall = task_list[i].result()
         img.paste(sub_img, (sub_panel_config["offset_x"], sub_panel_config["offset_y"]))
+        rainfall_map["future" if sub_panel_config["is_future"] else "current"] = rainfall
 
     executor.shutdown(True)
 
+    save_rainfall(rainfall_map)
+
     return draw_legend(img, bar, panel_config, face_map)
 
 
@@ -22,6 +22,7 @@ import my_lib.pil_util
 import PIL.Image
 import PIL.ImageDraw
 import pytz
+import weather_display.font_util
 from my_lib.sensor_data import fetch_data, get_last_event
 
 DATA_PATH = pathlib.Path("data")
@@ -33,9 +34,9 @@ CLOUD_IMAGE_XPATH = '//div[contains(@id, "jmatile_map_")]'
 
 def get_face_map(font_config):
     return {
-        "value": my_lib.pil_util.get_font(font_config, "en_bold", 80),
-        "unit": my_lib.pil_util.get_font(font_config, "en_bold", 30),
-        "start": my_lib.pil_util.get_font(font_config, "jp_medium", 40),
+        "value": weather_display.font_util.get_font(font_config, "en_bold", 80),
+        "unit": weather_display.font_util.get_font(font_config, "en_bold", 30),
+        "start": weather_display.font_util.get_font(font_config, "jp_medium", 40),
     }
 
 
@@ -131,32 +132,32 @@ def draw_rainfall(img, rainfall_status, icon_config, face_map):
     amount_text = gen_amount_text(rainfall_status["amount"])
     start_text = gen_start_text(rainfall_status["raining"]["start"])
 
-    line_height = my_lib.pil_util.text_size(img, face_map["value"], "0")[1]
+    line_height = weather_display.font_util.text_size(face_map["value"], "0")[1]
 
     pos_y = pos_y + icon.size[1] + 10
 
     next_pos_x = my_lib.pil_util.draw_text(
         img,
         amount_text,
-        (pos_x, pos_y + line_height - my_lib.pil_util.text_size(img, face_map["value"], "0")[1]),
+        (pos_x, pos_y + line_height - weather_display.font_util.text_size(face_map["value"], "0")[1]),
         face_map["value"],
         "left",
         "#333",
         stroke_width=10,
         stroke_fill=(255, 255, 255, 200),
     )[0]
-    next_pos_x += my_lib.pil_util.text_size(img, face_map["unit"], " ")[0]
+    next_pos_x += weather_display.font_util.text_size(face_map["unit"], " ")[0]
     next_pos_x = my_lib.pil_util.draw_text(
         img,
         "mm/h",
-        (next_pos_x, pos_y + line_height - my_lib.pil_util.text_size(img, face_map["unit"], "h")[1]),
+        (next_pos_x, pos_y + line_height - weather_display.font_util.text_size(face_map["unit"], "h")[1]),
         face_map["unit"],
         "left",
         "#333",
         stroke_width=10,
         stroke_fill=(255, 255, 255, 200),
     )[0]
-    next_pos_x += my_lib.pil_util.text_size(img, face_map["start"], " ")[0]
+    next_pos_x += weather_display.font_util.text_size(face_map["start"], " ")[0]
 
     pos_y = int(pos_y + line_height * 1.2)
     next_pos_x = my_lib.pil_util.draw_text(
@@ -24,6 +24,7 @@ import matplotlib.offsetbox
 import matplotlib.pyplot as plt
 import my_lib.panel_util
 import PIL.Image
+import weather_display.font_util
 from my_lib.sensor_data import fetch_data
 from pandas.plotting import register_matplotlib_converters
 
@@ -37,22 +38,14 @@ EMPTY_VALUE = -100.0
 AIRCON_WORK_THRESHOLD = 30
 
 
-def get_plot_font(config, font_type, size):
-    font_path = pathlib.Path(config["path"]).resolve() / config["map"][font_type]
-
-    logging.info("Load font: %s", font_path)
-
-    return mpl.font_manager.FontProperties(fname=font_path, size=size)
-
-
 def get_face_map(font_config):
     return {
-        "title": get_plot_font(font_config, "jp_bold", 34),
-        "value": get_plot_font(font_config, "en_cond", 65),
-        "value_small": get_plot_font(font_config, "en_cond", 55),
-        "value_unit": get_plot_font(font_config, "jp_regular", 18),
-        "yaxis": get_plot_font(font_config, "jp_regular", 20),
-        "xaxis": get_plot_font(font_config, "en_medium", 20),
+        "title": weather_display.font_util.get_plot_font(font_config, "jp_bold", 34),
+        "value": weather_display.font_util.get_plot_font(font_config, "en_cond", 65),
+        "value_small": weather_display.font_util.get_plot_font(font_config, "en_cond", 55),
+        "value_unit": weather_display.font_util.get_plot_font(font_config, "jp_regular", 18),
+        "yaxis": weather_display.font_util.get_plot_font(font_config, "jp_regular", 20),
+        "xaxis": weather_display.font_util.get_plot_font(font_config, "en_medium", 20),
     }
 
 
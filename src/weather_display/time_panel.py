@@ -19,12 +19,13 @@ import PIL.Image
 import PIL.ImageDraw
 import PIL.ImageEnhance
 import PIL.ImageFont
+import weather_display.font_util
 
 
 def get_face_map(font_config):
     return {
         "time": {
-            "value": my_lib.pil_util.get_font(font_config, "en_bold", 130),
+            "value": weather_display.font_util.get_font(font_config, "en_bold", 130),
         },
     }
 
@@ -35,7 +36,7 @@ def draw_time(img, pos_x, pos_y, face):
         + datetime.timedelta(minutes=1)
     ).strftime("%H:%M")
 
-    pos_y -= my_lib.pil_util.text_size(img, face["value"], time_text)[1]
+    pos_y -= weather_display.font_util.text_size(face["value"], time_text)[1]
     pos_x += 10
 
     my_lib.pil_util.draw_text(
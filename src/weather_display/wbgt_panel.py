@@ -18,14 +18,15 @@ import PIL.Image
 import PIL.ImageDraw
 import PIL.ImageEnhance
 import PIL.ImageFont
+import weather_display.font_util
 from my_lib.weather import get_wbgt
 
 
 def get_face_map(font_config):
     return {
-        "wbgt": my_lib.pil_util.get_font(font_config, "en_bold", 80),
-        "wbgt_symbol": my_lib.pil_util.get_font(font_config, "jp_bold", 120),
-        "wbgt_title": my_lib.pil_util.get_font(font_config, "jp_medium", 30),
+        "wbgt": weather_display.font_util.get_font(font_config, "en_bold", 80),
+        "wbgt_symbol": weather_display.font_util.get_font(font_config, "jp_bold", 120),
+        "wbgt_title": weather_display.font_util.get_font(font_config, "jp_medium", 30),
     }
 
 
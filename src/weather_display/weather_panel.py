@@ -4,19 +4,30 @@
 
 Usage:
   weather_panel.py [-c CONFIG] -o PNG_FILE
+  weather_panel.py -W
 
 Options:
   -c CONFIG    : CONFIG を設定ファイルとして読み込んで実行します．[default: config.yaml]
   -o PNG_FILE  : 生成した画像を指定されたパスに保存します．
+  -W           : 取得済みの全ての天気アイコンを，事前に変換してキャッシュします．
 """
 
+import collections
 import datetime
+import hashlib
 import locale
 import logging
 import math
+import os
 import pathlib
+import pickle
+import threading
+import time
 import urllib
+import urllib.error
 import urllib.parse
+import urllib.request
+from concurrent import futures
 
 import cv2
 import my_lib.panel_util
@@ -27,11 +38,53 @@ import PIL.Image
 import PIL.ImageDraw
 import PIL.ImageEnhance
 import PIL.ImageFont
+import weather_display.file_util
+import weather_display.font_util
 from my_lib.weather import get_clothing_yahoo, get_wbgt, get_weather_yahoo
 
+DATA_PATH = pathlib.Path("data")
+
+# NOTE: 天気予報等の取得のタイムアウト [秒]．並行して取得する
+FETCH_TIMEOUT_MAP = {"weather": 30, "clothing": 30, "sunset": 30, "wbgt": 30}
+
+# NOTE: 天気アイコンは URL ごとにキャッシュし，一定時間経過したら更新の有無を確認する
+ICON_CACHE_PATH = DATA_PATH / "weather_icon"
+ICON_CACHE_REVALIDATE_HOUR = 24
+# NOTE: キャッシュするアイコンの数の上限 (メモリ上とファイル)
+ICON_CACHE_MEMORY_MAX = 64
+ICON_CACHE_FILE_MAX = 256
+ICON_FETCH_TIMEOUT = 5
+# NOTE: アイコンが削除されたことを示す応答 (これ以外のエラーでは取得済みのアイコンを使う)
+ICON_GONE_CODE_LIST = [410]
+
+# NOTE: 変換済みの天気アイコンは，元画像と変換方法が同じなら使い回す
+ICON_IMAGE_CACHE_PATH = DATA_PATH / "weather_icon_image"
+# NOTE: 変換方法を変えた場合は更新する
+ICON_IMAGE_CACHE_FORMAT = 1
+ICON_TONE = 32
+ICON_GAMMA = 0.24
+ICON_SCALE = 1.9
+
+
+def create_icon_lut(tone, gamma):
+    # NOTE: 階調を削減した後にガンマ補正する変換を，一つのテーブルにまとめる
+    tone_table = np.minimum(np.ceil(np.arange(256) / tone) * tone, 255)
+
+    return (255 * (tone_table / 255) ** (1.0 / gamma)).astype(np.uint8)
+
+
+ICON_LUT = create_icon_lut(ICON_TONE, ICON_GAMMA)
+
+# NOTE: 環境変数 ICON_DUMP が true の場合，初めて見つかった天気アイコンを保存する (アイコン収集用)
+ICON_DUMP_PATH = pathlib.Path(__file__).parent / "img"
+
 # NOTE: 天気アイコンの周りにアイコンサイズの何倍の空きを確保するか
 ICON_MARGIN = 0.48
 
+# NOTE: 描画する時間帯 (3時間ごとの予報のうち，6時から21時まで)
+DRAW_HOUR_INDEX_START = 2
+DRAW_HOUR_INDEX_END = 8
+
 # NOTE: 現在の時間に対応する時間帯に描画する円の大きさ比率
 HOUR_CIRCLE_RATIO = 1.6
 
@@ -55,97 +108,257 @@ ROTATION_MAP = {
     "西南西": 293,
 }
 
+# NOTE: 風速 [m/s] ごとの文字色と矢印の明るさ (最後は 5 m/s 以上)
+WIND_STYLE = [
+    {"color": "#eee", "brightness": 8},
+    {"color": "#ddd", "brightness": 7.5},
+    {"color": "#bbb", "brightness": 6.5},
+    {"color": "#999", "brightness": 5.5},
+    {"color": "#666", "brightness": 3},
+    {"color": "#000", "brightness": 1},
+]
+
+icon_cache = collections.OrderedDict()
+icon_image_cache = collections.OrderedDict()
+icon_cache_lock = threading.Lock()
+
+upsampler = None
+upsampler_lock = threading.Lock()
+
+icon_dump_executor = None
+icon_dump_seen = set()
+
+sprite_cache = {}
+sprite_cache_lock = threading.Lock()
+
 
 def get_face_map(font_config):
     return {
         "date": {
-            "month": my_lib.pil_util.get_font(font_config, "en_cond_bold", 60),
-            "day": my_lib.pil_util.get_font(font_config, "en_bold", 160),
-            "wday": my_lib.pil_util.get_font(font_config, "jp_bold", 80),
-            "time": my_lib.pil_util.get_font(font_config, "en_cond_bold", 40),
+            "month": weather_display.font_util.get_font(font_config, "en_cond_bold", 60),
+            "day": weather_display.font_util.get_font(font_config, "en_bold", 160),
+            "wday": weather_display.font_util.get_font(font_config, "jp_bold", 80),
+            "time": weather_display.font_util.get_font(font_config, "en_cond_bold", 40),
         },
         "sunset": {
-            "value": my_lib.pil_util.get_font(font_config, "en_cond", 70),
+            "value": weather_display.font_util.get_font(font_config, "en_cond", 70),
         },
         "hour": {
-            "value": my_lib.pil_util.get_font(font_config, "en_medium", 60),
+            "value": weather_display.font_util.get_font(font_config, "en_medium", 60),
         },
         "temp": {
-            "value": my_lib.pil_util.get_font(font_config, "en_bold", 120),
-            "zero": my_lib.pil_util.get_font(font_config, "en_bold", 80),
-            "unit": my_lib.pil_util.get_font(font_config, "jp_regular", 30),
+            "value": weather_display.font_util.get_font(font_config, "en_bold", 120),
+            "zero": weather_display.font_util.get_font(font_config, "en_bold", 80),
+            "unit": weather_display.font_util.get_font(font_config, "jp_regular", 30),
         },
         "temp_sens": {
-            "value": my_lib.pil_util.get_font(font_config, "en_bold", 120),
-            "unit": my_lib.pil_util.get_font(font_config, "jp_regular", 30),
+            "value": weather_display.font_util.get_font(font_config, "en_bold", 120),
+            "unit": weather_display.font_util.get_font(font_config, "jp_regular", 30),
         },
         "precip": {
-            "value": my_lib.pil_util.get_font(font_config, "en_bold", 120),
-            "zero": my_lib.pil_util.get_font(font_config, "en_bold", 80),
-            "unit": my_lib.pil_util.get_font(font_config, "jp_regular", 30),
+            "value": weather_display.font_util.get_font(font_config, "en_bold", 120),
+            "zero": weather_display.font_util.get_font(font_config, "en_bold", 80),
+            "unit": weather_display.font_util.get_font(font_config, "jp_regular", 30),
         },
         "wind": {
-            "value": my_lib.pil_util.get_font(font_config, "en_bold", 120),
-            "unit": my_lib.pil_util.get_font(font_config, "jp_regular", 30),
-            "dir": my_lib.pil_util.get_font(font_config, "jp_regular", 30),
+            "value": weather_display.font_util.get_font(font_config, "en_bold", 120),
+            "unit": weather_display.font_util.get_font(font_config, "jp_regular", 30),
+            "dir": weather_display.font_util.get_font(font_config, "jp_regular", 30),
         },
         "weather": {
-            "value": my_lib.pil_util.get_font(font_config, "jp_regular", 30),
+            "value": weather_display.font_util.get_font(font_config, "jp_regular", 30),
         },
     }
 
 
+def get_cache_path(cache_dir, key):
+    return cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.pickle"
+
+
+def load_cache(cache_dir, memory_cache, key):
+    with icon_cache_lock:
+        if key in memory_cache:
+            memory_cache.move_to_end(key)
+            return memory_cache[key]
+
+    cache_path = get_cache_path(cache_dir, key)
+    if not cache_path.exists():
+        return None
+
+    try:
+        with cache_path.open("rb") as f:
+            value = pickle.load(f)  # noqa: S301
+    except Exception:
+        logging.warning("Failed to load cache: %s", cache_path)
+        return None
+
+    put_cache_memory(memory_cache, key, value)
+
+    return value
+
+
+def put_cache_memory(memory_cache, key, value):
+    with icon_cache_lock:
+        memory_cache[key] = value
+        memory_cache.move_to_end(key)
+        while len(memory_cache) > ICON_CACHE_MEMORY_MAX:
+            memory_cache.popitem(last=False)
+
+
+def save_cache(cache_dir, memory_cache, key, value):
+    put_cache_memory(memory_cache, key, value)
+
+    weather_display.file_util.write_atomic(get_cache_path(cache_dir, key), lambda f: pickle.dump(value, f))
+
+    cache_path_list = list(cache_dir.glob("*.pickle"))
+    if len(cache_path_list) <= ICON_CACHE_FILE_MAX:
+        return
+
+    # NOTE: 更新日時が古いものから削除する
+    for old_path in sorted(cache_path_list, key=lambda path: path.stat().st_mtime)[
+        : len(cache_path_list) - ICON_CACHE_FILE_MAX
+    ]:
+        old_path.unlink(missing_ok=True)
+
+
+def fetch_icon(url):
+    icon_entry = load_cache(ICON_CACHE_PATH, icon_cache, url)
+
+    if (icon_entry is not None) and (
+        (time.time() - icon_entry["time"]) < (ICON_CACHE_REVALIDATE_HOUR * 60 * 60)
+    ):
+        return icon_entry["data"]
+
+    req = urllib.request.Request(url)  # noqa: S310
+    if icon_entry is not None:
+        if icon_entry["etag"] is not None:
+            req.add_header("If-None-Match", icon_entry["etag"])
+        if icon_entry["last_modified"] is not None:
+            req.add_header("If-Modified-Since", icon_entry["last_modified"])
+
+    try:
+        with urllib.request.urlopen(req, timeout=ICON_FETCH_TIMEOUT) as res:  # noqa: S310
+            icon_entry = {
+                "data": res.read(),
+                "etag": res.headers.get("ETag"),
+                "last_modified": res.headers.get("Last-Modified"),
+            }
+    except urllib.error.HTTPError as e:
+        if (icon_entry is None) or (e.code in ICON_GONE_CODE_LIST):
+            raise
+        if e.code != 304:
+            logging.warning("Failed to revalidate weather icon (code: %d): %s", e.code, url)
+            return icon_entry["data"]
+        logging.debug("Weather icon is not modified: %s", url)
+    except Exception:
+        # NOTE: 取得済みのアイコンがあれば，サーバーの応答が無くても描画を続ける
+        if icon_entry is None:
+            raise
+        logging.warning("Failed to revalidate weather icon: %s", url)
+        return icon_entry["data"]
+
+    save_cache(ICON_CACHE_PATH, icon_cache, url, {**icon_entry, "time": time.time()})
+
+    return icon_entry["data"]
+
+
+def get_icon_image_key(icon_data):
+    return hashlib.sha256(
+        icon_data + repr((ICON_TONE, ICON_GAMMA, ICON_SCALE, ICON_IMAGE_CACHE_FORMAT)).encode()
+    ).hexdigest()
+
+
 def get_image(weather_info):
-    tone = 32
-    gamma = 0.24
+    icon_data = fetch_icon(weather_info["icon_url"])
+    key = get_icon_image_key(icon_data)
 
-    file_bytes = np.asarray(
-        bytearray(urllib.request.urlopen(weather_info["icon_url"]).read()),  # noqa: S310
-        dtype=np.uint8,
-    )
-    img = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
+    if os.environ.get("ICON_DUMP", "false") == "true":
+        submit_icon_dump(icon_data, weather_info)
+
+    icon = load_cache(ICON_IMAGE_CACHE_PATH, icon_image_cache, key)
+    if icon is None:
+        icon = convert_icon(icon_data)
+        save_cache(ICON_IMAGE_CACHE_PATH, icon_image_cache, key, icon)
+
+    return icon
+
+
+def get_image_map(weather_list):
+    # NOTE: 描画に使うアイコンをまとめて準備する．同じアイコンは一度だけ処理する
+    return {
+        icon_url: get_image(weather)
+        for icon_url, weather in {weather["icon_url"]: weather for weather in weather_list}.items()
+    }
+
+
+def decode_icon(icon_data):
+    img = cv2.imdecode(np.frombuffer(icon_data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
 
     # NOTE: 透過部分を白で塗りつぶす
     img[img[..., -1] == 0] = [255, 255, 255, 0]
-    img = img[:, :, :3]
-
-    dump_path = str(
-        pathlib.Path(__file__).parent
-        / "img"
-        / (
-            weather_info["text"]
-            + "_"
-            + pathlib.Path(urllib.parse.urlparse(weather_info["icon_url"]).path).name
-        )
+
+    return img[:, :, :3]
+
+
+def get_icon_dump_path(weather_info):
+    return ICON_DUMP_PATH / (
+        weather_info["text"] + "_" + pathlib.Path(urllib.parse.urlparse(weather_info["icon_url"]).path).name
     )
 
-    PIL.Image.fromarray(img).save(dump_path)
 
-    h, w = img.shape[:2]
+def submit_icon_dump(icon_data, weather_info):
+    global icon_dump_executor  # noqa: PLW0603
 
-    # NOTE: 一旦4倍の解像度に増やす
-    sr = cv2.dnn_superres.DnnSuperResImpl_create()
+    dump_path = get_icon_dump_path(weather_info)
+
+    with icon_cache_lock:
+        if dump_path in icon_dump_seen:
+            return None
+        icon_dump_seen.add(dump_path)
+
+        if icon_dump_executor is None:
+            icon_dump_executor = futures.ThreadPoolExecutor(1)
+
+    if dump_path.exists():
+        return None
+
+    # NOTE: 描画を待たせないよう，保存は別スレッドで行う
+    return icon_dump_executor.submit(dump_icon, icon_data, dump_path)
+
+
+def dump_icon(icon_data, dump_path):
+    logging.info("Dump weather icon: %s", dump_path)
+
+    PIL.Image.fromarray(decode_icon(icon_data)).save(dump_path)
+
+
+def upsample_icon(img):
+    global upsampler  # noqa: PLW0603
 
-    model_path = str(pathlib.Path(__file__).parent / "data" / "ESPCN_x4.pb")
+    # NOTE: モデルの読み込みは重いので，プロセス内で一度だけ行う
+    with upsampler_lock:
+        if upsampler is None:
+            upsampler = cv2.dnn_superres.DnnSuperResImpl_create()
+            upsampler.readModel(str(pathlib.Path(__file__).parent / "data" / "ESPCN_x4.pb"))
+            upsampler.setModel("espcn", 4)
 
-    sr.readModel(model_path)
-    sr.setModel("espcn", 4)
-    img = sr.upsample(img)
+        return upsampler.upsample(img)
 
-    # NOTE: 階調を削減
-    tone_table = np.zeros((256, 1), dtype=np.uint8)
-    for i in range(256):
-        tone_table[i][0] = min(math.ceil(i / tone) * tone, 255)
-    img = cv2.LUT(img, tone_table)
 
-    # NOTE: ガンマ補正
-    gamma_table = np.zeros((256, 1), dtype=np.uint8)
-    for i in range(256):
-        gamma_table[i][0] = 255 * (float(i) / 255) ** (1.0 / gamma)
-    img = cv2.LUT(img, gamma_table)
+def convert_icon(icon_data):
+    logging.info("Convert weather icon")
+
+    img = decode_icon(icon_data)
+    h, w = img.shape[:2]
+
+    # NOTE: 一旦4倍の解像度に増やす
+    img = upsample_icon(img)
+
+    # NOTE: 階調の削減とガンマ補正
+    img = cv2.LUT(img, ICON_LUT)
 
     # NOTE: 最終的に欲しい解像度にする
-    img = cv2.resize(img, (int(w * 1.9), int(h * 1.9)), interpolation=cv2.INTER_CUBIC)
+    img = cv2.resize(img, (int(w * ICON_SCALE), int(h * ICON_SCALE)), interpolation=cv2.INTER_CUBIC)
 
     # NOTE: 白色を透明にする
     img = cv2.cvtColor(img, cv2.COLOR_RGB2RGBA)
@@ -154,18 +367,34 @@ def get_image(weather_info):
     return PIL.Image.fromarray(img).convert("LA")
 
 
+def prewarm_icon():
+    # NOTE: 取得済みの全ての天気アイコンを変換しておく
+    count = 0
+    for cache_path in sorted(ICON_CACHE_PATH.glob("*.pickle")):
+        with cache_path.open("rb") as f:
+            icon_entry = pickle.load(f)  # noqa: S301
+
+        key = get_icon_image_key(icon_entry["data"])
+        if load_cache(ICON_IMAGE_CACHE_PATH, icon_image_cache, key) is not None:
+            continue
+
+        save_cache(ICON_IMAGE_CACHE_PATH, icon_image_cache, key, convert_icon(icon_entry["data"]))
+        count += 1
+
+    logging.info("Prewarm %d weather icons.", count)
+
+    return count
+
+
 # NOTE: 体感温度の計算 (Gregorczuk, 1972)
 def calc_misnar_formula(temp, humi, wind):
     a = 1.76 + 1.4 * (wind**0.75)
     return 37 - (37 - temp) / (0.68 - 0.0014 * humi + 1 / a) - 0.29 * temp * (1 - humi / 100)
 
 
-def draw_weather(img, weather, overlay, pos_x, pos_y, icon_margin, face_map):  # noqa: PLR0913
-    icon = get_image(weather)
-
-    canvas = overlay.copy()
-    canvas.paste(icon, (int(pos_x), int(pos_y)))
-    img.alpha_composite(canvas, (0, 0))
+def draw_weather(img, weather, icon, pos_x, pos_y, icon_margin, face_map):  # noqa: PLR0913
+    # NOTE: アイコンの範囲だけを合成する
+    img.alpha_composite(icon.convert("RGBA"), (int(pos_x), int(pos_y)))
 
     next_pos_y = pos_y
     next_pos_y += icon.size[1] * 1.08
@@ -193,23 +422,29 @@ def draw_text_info(  # noqa: PLR0913
     underline=False,
     margin_top_ratio=0.3,
 ):
-    pos_y += my_lib.pil_util.text_size(img, face["value"], "0")[1] * margin_top_ratio
+    pos_y += weather_display.font_util.text_size(face["value"], "0")[1] * margin_top_ratio
 
     if is_first:
         my_lib.pil_util.alpha_paste(
             img,
             icon,
             (
-                int(pos_x - icon.size[0] / 2 - my_lib.pil_util.text_size(img, face["value"], "0")[0] * 0.4),
-                int(pos_y + (my_lib.pil_util.text_size(img, face["value"], "0")[1] - icon.size[1]) / 2.0),
+                int(
+                    pos_x
+                    - icon.size[0] / 2
+                    - weather_display.font_util.text_size(face["value"], "0")[0] * 0.4
+                ),
+                int(
+                    pos_y + (weather_display.font_util.text_size(face["value"], "0")[1] - icon.size[1]) / 2.0
+                ),
             ),
         )
 
-    value_pos_x = pos_x + my_lib.pil_util.text_size(img, face["value"], "10")[0]
+    value_pos_x = pos_x + weather_display.font_util.text_size(face["value"], "10")[0]
     unit_pos_y = (
         pos_y
-        + my_lib.pil_util.text_size(img, face["value"], "0")[1]
-        - my_lib.pil_util.text_size(img, face["unit"], "℃")[1]
+        + weather_display.font_util.text_size(face["value"], "0")[1]
+        - weather_display.font_util.text_size(face["unit"], "℃")[1]
     )
     unit_pos_x = value_pos_x + 5
 
@@ -224,10 +459,10 @@ def draw_text_info(  # noqa: PLR0913
             "right",
             color,
         )
-        int_pos_x = value_pos_x - my_lib.pil_util.text_size(img, face["value"], tenth_text)[0]
+        int_pos_x = value_pos_x - weather_display.font_util.text_size(face["value"], tenth_text)[0]
         int_pos_y = pos_y + (
-            my_lib.pil_util.text_size(img, face["value"], tenth_text)[1]
-            - my_lib.pil_util.text_size(img, face["zero"], "0.")[1]
+            weather_display.font_util.text_size(face["value"], tenth_text)[1]
+            - weather_display.font_util.text_size(face["zero"], "0.")[1]
         )
         my_lib.pil_util.draw_text(
             img,
@@ -237,7 +472,7 @@ def draw_text_info(  # noqa: PLR0913
             "right",
             color,
         )
-        value_start_x = int_pos_x - my_lib.pil_util.text_size(img, face["zero"], "0.")[0]
+        value_start_x = int_pos_x - weather_display.font_util.text_size(face["zero"], "0.")[0]
     else:
         if value < -0.5:
             value_text = f"{value:.0f}"
@@ -256,9 +491,9 @@ def draw_text_info(  # noqa: PLR0913
             "right",
             color,
         )
-        value_start_x = value_pos_x - my_lib.pil_util.text_size(img, face["value"], value_text)[0]
+        value_start_x = value_pos_x - weather_display.font_util.text_size(face["value"], value_text)[0]
 
-    next_pos_y = pos_y + my_lib.pil_util.text_size(img, face["value"], "0")[1]
+    next_pos_y = pos_y + weather_display.font_util.text_size(face["value"], "0")[1]
 
     if underline:
         draw = PIL.ImageDraw.Draw(img)
@@ -332,41 +567,55 @@ def draw_precip(img, precip, is_first, pos_x, pos_y, precip_icon, face):  # noqa
     )
 
 
+def get_wind_level(speed):
+    # NOTE: 風速 0〜4 m/s はそれぞれ区別し，それ以外はまとめて扱う
+    return int(speed) if speed in range(len(WIND_STYLE) - 1) else len(WIND_STYLE) - 1
+
+
+def get_sprite(key, create_func, *args):
+    with sprite_cache_lock:
+        if key in sprite_cache:
+            return sprite_cache[key]
+
+    sprite = create_func(*args)
+
+    with sprite_cache_lock:
+        sprite_cache[key] = sprite
+
+    return sprite
+
+
+def create_arrow_atlas(arrow_icon):
+    # NOTE: 全ての風向と風速の組み合わせについて，矢印を用意しておく
+    return {
+        (wind_dir, level): PIL.ImageEnhance.Brightness(arrow_icon)
+        .enhance(style["brightness"])
+        .rotate(rotation, resample=PIL.Image.BICUBIC)
+        for wind_dir, rotation in ROTATION_MAP.items()
+        if rotation is not None
+        for level, style in enumerate(WIND_STYLE)
+    }
+
+
+def create_shadow_icon(icon):
+    return PIL.ImageEnhance.Brightness(icon).enhance(1.9)
+
+
 def draw_wind(img, wind, is_first, pos_x, pos_y, icon, face):  # noqa: PLR0913
-    pos_y += my_lib.pil_util.text_size(img, face["value"], "0")[1] * 0.2  # NOTE: 上にマージンを設ける
+    pos_y += weather_display.font_util.text_size(face["value"], "0")[1] * 0.2  # NOTE: 上にマージンを設ける
 
-    if wind["speed"] == 0:
-        color = "#eee"
-        brightness = 8
-    elif wind["speed"] == 1:
-        color = "#ddd"
-        brightness = 7.5
-    elif wind["speed"] == 2:
-        color = "#bbb"
-        brightness = 6.5
-    elif wind["speed"] == 3:
-        color = "#999"
-        brightness = 5.5
-    elif wind["speed"] == 4:
-        color = "#666"
-        brightness = 3
-    else:
-        color = "#000"
-        brightness = 1
+    level = get_wind_level(wind["speed"])
+    color = WIND_STYLE[level]["color"]
 
     icon_orig_height = icon["arrow"].size[1]
     if ROTATION_MAP[wind["dir"]] is not None:
-        arrow_icon = PIL.ImageEnhance.Brightness(icon["arrow"]).enhance(brightness)
-        arrow_icon = arrow_icon.rotate(
-            ROTATION_MAP[wind["dir"]],
-            resample=PIL.Image.BICUBIC,
-        )
+        arrow_icon = icon["arrow_atlas"][(wind["dir"], level)]
 
         my_lib.pil_util.alpha_paste(
             img,
             arrow_icon,
             (
-                int(pos_x + my_lib.pil_util.text_size(img, face["value"], "10")[0] - arrow_icon.size[0]),
+                int(pos_x + weather_display.font_util.text_size(face["value"], "10")[0] - arrow_icon.size[0]),
                 int(pos_y + (icon_orig_height - icon["arrow"].size[1]) / 2.0),
             ),
         )
@@ -387,8 +636,7 @@ def draw_wind(img, wind, is_first, pos_x, pos_y, icon, face):  # noqa: PLR0913
     )
 
     next_pos_y += (
-        my_lib.pil_util.text_size(
-            img,
+        weather_display.font_util.text_size(
             face["dir"],
             "南",
         )[1]
@@ -399,7 +647,7 @@ def draw_wind(img, wind, is_first, pos_x, pos_y, icon, face):  # noqa: PLR0913
         img,
         wind["dir"],
         [
-            pos_x + my_lib.pil_util.text_size(img, face["value"], "10")[0],
+            pos_x + weather_display.font_util.text_size(face["value"], "10")[0],
             next_pos_y,
         ],
         face["dir"],
@@ -420,7 +668,7 @@ def draw_hour(img, hour, is_today, pos_x, pos_y, face_map):  # noqa: PLR0913
         or (cur_hour >= 21 and hour == 21)
     ):
         draw = PIL.ImageDraw.Draw(img)
-        circle_height = my_lib.pil_util.text_size(img, face["value"], str(21))[1]
+        circle_height = weather_display.font_util.text_size(face["value"], str(21))[1]
 
         draw.ellipse(
             (
@@ -448,7 +696,7 @@ def draw_hour(img, hour, is_today, pos_x, pos_y, face_map):  # noqa: PLR0913
             "center",
         )
 
-    return pos_y + my_lib.pil_util.text_size(img, face["value"], "0")[1]
+    return pos_y + weather_display.font_util.text_size(face["value"], "0")[1]
 
 
 def draw_weather_info(  # noqa: PLR0913
@@ -460,13 +708,20 @@ def draw_weather_info(  # noqa: PLR0913
     is_first,
     pos_x,
     pos_y,
-    overlay,
     icon,
     face_map,
 ):
-    next_pos_y = pos_y + my_lib.pil_util.text_size(img, face_map["hour"]["value"], "0")[1] * HOUR_CIRCLE_RATIO
+    next_pos_y = (
+        pos_y + weather_display.font_util.text_size(face_map["hour"]["value"], "0")[1] * HOUR_CIRCLE_RATIO
+    )
     next_pos_x, next_pos_y = draw_weather(
-        img, info["weather"], overlay, pos_x, next_pos_y, ICON_MARGIN, face_map
+        img,
+        info["weather"],
+        icon["weather"][info["weather"]["icon_url"]],
+        pos_x,
+        next_pos_y,
+        ICON_MARGIN,
+        face_map,
     )
     draw_hour(
         img,
@@ -532,19 +787,18 @@ def draw_weather_info(  # noqa: PLR0913
     return pos_x + (next_pos_x - pos_x) * 1.0
 
 
-def draw_day_weather(img, info, wbgt_info, is_today, pos_x, pos_y, overlay, icon, face_map):  # noqa: PLR0913
+def draw_day_weather(img, info, wbgt_info, is_today, pos_x, pos_y, icon, face_map):  # noqa: PLR0913
     next_pos_x = pos_x
-    for hour_index in range(2, 8):
+    for hour_index in range(DRAW_HOUR_INDEX_START, DRAW_HOUR_INDEX_END):
         next_pos_x = draw_weather_info(
             img,
             info[hour_index],
             wbgt_info[hour_index] if wbgt_info is not None else None,
             wbgt_info is not None,
             is_today,
-            hour_index == 2,
+            hour_index == DRAW_HOUR_INDEX_START,
             next_pos_x,
             pos_y,
-            overlay,
             icon,
             face_map,
         )
@@ -553,7 +807,7 @@ def draw_day_weather(img, info, wbgt_info, is_today, pos_x, pos_y, overlay, icon
 def draw_date(img, pos_x, pos_y, date, face_map):
     face = face_map["date"]
 
-    next_pos_x = pos_x + my_lib.pil_util.text_size(img, face["day"], "31")[0]
+    next_pos_x = pos_x + weather_display.font_util.text_size(face["day"], "31")[0]
     text_pos_x = (pos_x + next_pos_x) / 2.0
 
     locale.setlocale(locale.LC_TIME, "en_US.UTF-8")
@@ -579,7 +833,7 @@ def draw_date(img, pos_x, pos_y, date, face_map):
         date.strftime("(%a)"),
         [
             text_pos_x,
-            next_pos_y + my_lib.pil_util.text_size(img, face["wday"], "(土)")[1] * 0.2,
+            next_pos_y + weather_display.font_util.text_size(face["wday"], "(土)")[1] * 0.2,
         ],
         face["wday"],
         "center",
@@ -594,7 +848,7 @@ def draw_sunset(img, pos_x, pos_y, sunset_info, icon, face_map):  # noqa: PLR091
     face = face_map["sunset"]
 
     icon_width, icon_height = icon["sunset"].size
-    text_width, text_height = my_lib.pil_util.text_size(img, face["value"], sunset_info)
+    text_width, text_height = weather_display.font_util.text_size(face["value"], sunset_info)
 
     icon_pos = (
         int(pos_x - text_width / 2 - icon_width + OFFSET),
@@ -626,7 +880,7 @@ def draw_clothing(img, pos_x, pos_y, clothing_info, icon):
     half_icon = icon[f"clothing-half-{icon_index}"]
     icon_width, icon_height = full_icon.size
 
-    shadow_icon = PIL.ImageEnhance.Brightness(full_icon).enhance(1.9)
+    shadow_icon = icon[f"clothing-shadow-{icon_index}"]
 
     for i in range(5):
         if clothing_info >= 20 * (i + 1):
@@ -656,7 +910,6 @@ def draw_panel_weather_day(  # noqa: PLR0913
     sunset_info,
     wbgt_info,
     is_today,
-    overlay,
     icon,
     face_map,
 ):
@@ -674,7 +927,6 @@ def draw_panel_weather_day(  # noqa: PLR0913
         is_today,
         next_pos_x + 50,
         pos_y + 5,
-        overlay,
         icon,
         face_map,
     )
@@ -688,6 +940,7 @@ def draw_panel_weather(  # noqa: PLR0913
     clothing_info,
     sunset_info,
     wbgt_info,
+    weather_icon_map,
     is_side_by_side,
 ):
     icon = {}
@@ -712,6 +965,19 @@ def draw_panel_weather(  # noqa: PLR0913
     ]:
         icon[name] = my_lib.pil_util.load_image(panel_config["icon"][name])
 
+    # NOTE: 矢印や影のアイコンは加工済みのものを使い回す
+    icon["arrow_atlas"] = get_sprite(
+        ("arrow", repr(panel_config["icon"]["arrow"])), create_arrow_atlas, icon["arrow"]
+    )
+    for i in range(1, 6):
+        icon[f"clothing-shadow-{i}"] = get_sprite(
+            ("shadow", repr(panel_config["icon"][f"clothing-full-{i}"])),
+            create_shadow_icon,
+            icon[f"clothing-full-{i}"],
+        )
+
+    icon["weather"] = weather_icon_map
+
     face_map = get_face_map(font_config)
 
     pos_x = 10
@@ -726,7 +992,6 @@ def draw_panel_weather(  # noqa: PLR0913
         sunset_info["today"],
         wbgt_info["daily"]["today"],
         True,
-        img.copy(),
         icon,
         face_map,
     )
@@ -744,17 +1009,58 @@ def draw_panel_weather(  # noqa: PLR0913
         sunset_info["tomorrow"],
         wbgt_info["daily"]["tomorrow"],
         False,
-        img.copy(),
         icon,
         face_map,
     )
 
 
+def get_weather_icon_map(weather_info):
+    return get_image_map(
+        [
+            info["weather"]
+            for day in ["today", "tomorrow"]
+            for info in weather_info[day]["data"][DRAW_HOUR_INDEX_START:DRAW_HOUR_INDEX_END]
+        ]
+    )
+
+
+def prepare_weather_icon(weather_task):
+    return get_weather_icon_map(weather_task.result())
+
+
+def fetch_weather_data(panel_config, opt_config):
+    executor = futures.ThreadPoolExecutor(len(FETCH_TIMEOUT_MAP) + 1)
+
+    try:
+        task_map = {
+            "weather": executor.submit(get_weather_yahoo, panel_config["data"]["yahoo"]),
+            "clothing": executor.submit(get_clothing_yahoo, panel_config["data"]["yahoo"]),
+            "sunset": executor.submit(my_lib.weather.get_sunset_nao, opt_config["sunset"]),
+            "wbgt": executor.submit(get_wbgt, opt_config["wbgt"]),
+        }
+        # NOTE: 天気予報が届いたら，他のデータを待つ間にアイコンを準備する
+        icon_task = executor.submit(prepare_weather_icon, task_map["weather"])
+
+        start_time = time.time()
+        data_map = {}
+        # NOTE: タイムアウトが短いものから順に待つ
+        for name in sorted(task_map, key=lambda name: FETCH_TIMEOUT_MAP[name]):
+            try:
+                data_map[name] = task_map[name].result(
+                    timeout=max(start_time + FETCH_TIMEOUT_MAP[name] - time.time(), 0)
+                )
+            except futures.TimeoutError:
+                raise TimeoutError(f"{name} の取得がタイムアウトしました．") from None
+
+        data_map["icon"] = icon_task.result()
+
+        return data_map
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def create_weather_panel_impl(panel_config, font_config, slack_config, is_side_by_side, trial, opt_config):  # noqa: ARG001, PLR0913
-    weather_info = get_weather_yahoo(panel_config["data"]["yahoo"])
-    clothing_info = get_clothing_yahoo(panel_config["data"]["yahoo"])
-    sunset_info = my_lib.weather.get_sunset_nao(opt_config["sunset"])
-    wbgt_info = get_wbgt(opt_config["wbgt"])
+    data_map = fetch_weather_data(panel_config, opt_config)
 
     img = PIL.Image.new(
         "RGBA",
@@ -766,10 +1072,11 @@ def create_weather_panel_impl(panel_config, font_config, slack_config, is_side_b
         img,
         panel_config,
         font_config,
-        weather_info,
-        clothing_info,
-        sunset_info,
-        wbgt_info,
+        data_map["weather"],
+        data_map["clothing"],
+        data_map["sunset"],
+        data_map["wbgt"],
+        data_map["icon"],
         is_side_by_side,
     )
 
@@ -790,6 +1097,8 @@ def create(config, is_side_by_side=True):
 
 
 if __name__ == "__main__":
+    import sys
+
     import docopt
     import my_lib.config
     import my_lib.logger
@@ -798,6 +1107,10 @@ if __name__ == "__main__":
 
     my_lib.logger.init("test", level=logging.INFO)
 
+    if args["-W"]:
+        prewarm_icon()
+        sys.exit(0)
+
     config = my_lib.config.load(args["-c"])
     out_file = args["-o"]
 
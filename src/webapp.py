@@ -3,11 +3,13 @@
 電子ペーパ表示用の画像を表示する簡易的な Web サーバです．
 
 Usage:
-  webapp.py [-c CONFIG] [-s CONFIG] [-D]
+  webapp.py [-c CONFIG] [-s CONFIG] [-p] [-A] [-D]
 
 Options:
   -c CONFIG    : 通常モードで使う設定ファイルを指定します．[default: config.yaml]
   -s CONFIG    : 小型ディスプレイモード使う設定ファイルを指定します．[default: config-small.yaml]
+  -p           : 最新の画像をバックグラウンドで事前生成しておきます．
+  -A           : asyncio ベースの ASGI サーバで実行します．
   -D           : ダミーモードで実行します．
 """
 
@@ -25,24 +27,38 @@ from flask_cors import CORS
 SCHEMA_CONFIG = "config.schema"
 
 
-def create_app(config_file_normal, config_file_small, dummy_mode=False):
-    # NOTE: アクセスログは無効にする
-    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+def init_generator(config_file_normal, config_file_small, dummy_mode, prerender):
+    # NOTE: オプションでダミーモードが指定された場合，環境変数もそれに揃えておく
+    if dummy_mode:
+        logging.warning("Set dummy mode")
+        os.environ["DUMMY_MODE"] = "true"
+    else:  # pragma: no cover
+        pass
 
-    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        # NOTE: オプションでダミーモードが指定された場合，環境変数もそれに揃えておく
-        if dummy_mode:
-            logging.warning("Set dummy mode")
-            os.environ["DUMMY_MODE"] = "true"
-        else:  # pragma: no cover
-            pass
+    weather_display.generator.init(
+        pathlib.Path(__file__).parent / "create_image.py",
+        (
+            {
+                "config_file": {"normal": config_file_normal, "small": config_file_small},
+                "is_dummy_mode": dummy_mode,
+            }
+            if prerender
+            else None
+        ),
+    )
+
+    def notify_terminate():  # pragma: no cover
+        weather_display.generator.term()
 
-        weather_display.generator.init(pathlib.Path(__file__).parent / "create_image.py")
+    atexit.register(notify_terminate)
 
-        def notify_terminate():  # pragma: no cover
-            weather_display.generator.term()
 
-        atexit.register(notify_terminate)
+def create_app(config_file_normal, config_file_small, dummy_mode=False, prerender=False):
+    # NOTE: アクセスログは無効にする
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        init_generator(config_file_normal, config_file_small, dummy_mode, prerender)
     else:  # pragma: no cover
         pass
 
@@ -70,6 +86,49 @@ def create_app(config_file_normal, config_file_small, dummy_mode=False):
     return app
 
 
+def create_async_app(config_file_normal, config_file_small, dummy_mode=False):
+    import weather_display.generator_async
+    from quart import Quart
+
+    app = Quart("unit_cooler")
+
+    # NOTE: flask_cors 相当の設定
+    @app.after_request
+    async def allow_origin(res):
+        res.headers.setdefault("Access-Control-Allow-Origin", "*")
+        return res
+
+    app.config["CONFIG_FILE_NORMAL"] = config_file_normal
+    app.config["CONFIG_FILE_SMALL"] = config_file_small
+    app.config["DUMMY_MODE"] = dummy_mode
+
+    app.register_blueprint(weather_display.generator_async.blueprint)
+
+    return app
+
+
+def create_asgi_app(config_file_normal, config_file_small, dummy_mode=False, prerender=False):
+    import hypercorn.middleware
+    import weather_display.generator_async
+
+    # NOTE: 静的ファイル等は既存の Flask アプリで処理し，ストリーミングや画像生成の API
+    # のみをイベントループ上の Quart アプリで処理する．
+    init_generator(config_file_normal, config_file_small, dummy_mode, prerender)
+
+    wsgi_app = hypercorn.middleware.AsyncioWSGIMiddleware(
+        create_app(config_file_normal, config_file_small, dummy_mode)
+    )
+    async_app = create_async_app(config_file_normal, config_file_small, dummy_mode)
+
+    async def asgi_app(scope, receive, send):
+        if (scope["type"] == "lifespan") or weather_display.generator_async.is_async_path(scope["path"]):
+            await async_app(scope, receive, send)
+        else:
+            await wsgi_app(scope, receive, send)
+
+    return asgi_app
+
+
 if __name__ == "__main__":
     import docopt
 
@@ -77,11 +136,28 @@ if __name__ == "__main__":
 
     config_file_normal = args["-c"]
     config_file_small = args["-s"]
+    prerender = args["-p"]
+    async_mode = args["-A"]
     dummy_mode = args["-D"]
 
     my_lib.logger.init("panel.e-ink.weather", level=logging.INFO)
 
-    app = create_app(config_file_normal, config_file_small, dummy_mode)
+    if async_mode:
+        import asyncio
+
+        import hypercorn.asyncio
+        import hypercorn.config
+
+        app = create_asgi_app(config_file_normal, config_file_small, dummy_mode, prerender)
+
+        hypercorn_config = hypercorn.config.Config()
+        hypercorn_config.bind = ["0.0.0.0:5000"]
+        # NOTE: アクセスログは無効にする
+        hypercorn_config.accesslog = None
+
+        asyncio.run(hypercorn.asyncio.serve(app, hypercorn_config))
+    else:
+        app = create_app(config_file_normal, config_file_small, dummy_mode, prerender)
 
-    # NOTE: スクリプトの自動リロード停止したい場合は use_reloader=False にする
-    app.run(host="0.0.0.0", threaded=True, use_reloader=True)  # noqa: S104
+        # NOTE: スクリプトの自動リロード停止したい場合は use_reloader=False にする
+        app.run(host="0.0.0.0", threaded=True, use_reloader=True)  # noqa: S104
@@ -57,11 +57,21 @@ def app():
 
 @pytest.fixture(autouse=True)
 def _clear():
+    import shutil
+
     import my_lib.notify.slack
+    import weather_display.rain_cloud_panel
+    import weather_display.weather_panel
 
     config = my_lib.config.load(CONFIG_FILE)
 
     pathlib.Path(config["liveness"]["file"]["display"]).unlink(missing_ok=True)
+    shutil.rmtree(weather_display.rain_cloud_panel.CLOUD_CACHE_PATH, ignore_errors=True)
+    shutil.rmtree(weather_display.weather_panel.ICON_CACHE_PATH, ignore_errors=True)
+    shutil.rmtree(weather_display.weather_panel.ICON_IMAGE_CACHE_PATH, ignore_errors=True)
+    weather_display.weather_panel.icon_cache.clear()
+    weather_display.weather_panel.icon_image_cache.clear()
+    weather_display.rain_cloud_panel.basetime_cache.clear()
 
     my_lib.notify.slack.interval_clear()
     my_lib.notify.slack.hist_clear()
@@ -76,6 +86,51 @@ def client(app):
     test_client.delete()
 
 
+@pytest.fixture()
+def http_server():
+    import http.server
+    import threading
+
+    server_list = []
+
+    # NOTE: GET の応答を do_get で返すテスト用のサーバーを起動し，URL と停止用の関数を返す
+    def start(do_get):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                do_get(self)
+
+            def send_data(self, data, content_type, header_map=None):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (header_map or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        server_list.append(stop)
+
+        return (f"http://127.0.0.1:{server.server_address[1]}", stop)
+
+    yield start
+
+    # NOTE: テスト中に停止済みでも問題ない
+    for stop in server_list:
+        stop()
+
+
 def gen_wbgt_info():
     return {
         "current": 32,
@@ -359,6 +414,277 @@ def test_weather_panel_dummy(mocker, request, tmp_path):
     check_notify_slack(None)
 
 
+def test_weather_panel_fetch(mocker, request, tmp_path):
+    import time
+
+    import weather_display.weather_panel
+
+    def slow_fetch(value):
+        def fetch(*args):  # noqa: ARG001
+            time.sleep(0.5)
+            return value
+
+        return fetch
+
+    mocker.patch("weather_display.weather_panel.get_weather_yahoo", side_effect=slow_fetch("weather"))
+    mocker.patch("weather_display.weather_panel.get_clothing_yahoo", side_effect=slow_fetch("clothing"))
+    mocker.patch("my_lib.weather.get_sunset_nao", side_effect=slow_fetch("sunset"))
+    mocker.patch("weather_display.weather_panel.get_wbgt", side_effect=slow_fetch("wbgt"))
+    mocker.patch("weather_display.weather_panel.get_weather_icon_map", side_effect=slow_fetch("icon"))
+
+    config = load_test_config(CONFIG_FILE, tmp_path, request)
+    opt_config = {"sunset": config["sunset"], "wbgt": config["wbgt"]}
+
+    # NOTE: 並行して取得するので，一番遅いものを待つだけで済むこと
+    start_time = time.time()
+    data_map = weather_display.weather_panel.fetch_weather_data(config["weather"], opt_config)
+    assert data_map == {name: name for name in ["weather", "clothing", "sunset", "wbgt", "icon"]}
+    assert time.time() - start_time < 1.5
+
+    mocker.patch.dict(weather_display.weather_panel.FETCH_TIMEOUT_MAP, {"wbgt": 0.1})
+    with pytest.raises(TimeoutError, match="wbgt"):
+        weather_display.weather_panel.fetch_weather_data(config["weather"], opt_config)
+
+
+def test_font_util_text_size(mocker):
+    import my_lib.pil_util
+    import PIL.Image
+    import weather_display.font_util
+
+    config = my_lib.config.load(CONFIG_FILE)
+    font = my_lib.pil_util.get_font(config["font"], "en_bold", 120)
+
+    mocker.patch.dict(weather_display.font_util.text_size_cache, clear=True)
+    text_size = mocker.spy(my_lib.pil_util, "text_size")
+
+    size = weather_display.font_util.text_size(font, "10")
+    assert size == my_lib.pil_util.text_size(PIL.Image.new("RGBA", (100, 100)), font, "10")
+
+    # NOTE: 同じフォントと文字列の大きさは計測し直さないこと
+    for _ in range(10):
+        assert weather_display.font_util.text_size(font, "10") == size
+    assert text_size.call_count == 2
+
+
+def test_font_util_get_font(mocker):
+    import my_lib.pil_util
+    import weather_display.font_util
+
+    config = my_lib.config.load(CONFIG_FILE)
+
+    mocker.patch.dict(weather_display.font_util.font_cache, clear=True)
+    get_font = mocker.spy(my_lib.pil_util, "get_font")
+
+    # NOTE: 同じフォントと大きさであれば，読み込み済みのものを使い回すこと
+    font = weather_display.font_util.get_font(config["font"], "en_bold", 120)
+    assert weather_display.font_util.get_font(config["font"], "en_bold", 120) is font
+    assert weather_display.font_util.get_font(config["font"], "en_bold", 80) is not font
+    assert get_font.call_count == 2
+
+    plot_font = weather_display.font_util.get_plot_font(config["font"], "jp_regular", 20)
+    assert weather_display.font_util.get_plot_font(config["font"], "jp_regular", 20) is plot_font
+    assert plot_font.get_size() == 20
+
+
+def test_weather_arrow_atlas(mocker):
+    import my_lib.pil_util
+    import PIL.Image
+    import PIL.ImageEnhance
+    import weather_display.weather_panel
+
+    config = my_lib.config.load(CONFIG_FILE)
+    arrow_icon = my_lib.pil_util.load_image(config["weather"]["icon"]["arrow"])
+
+    mocker.patch.dict(weather_display.weather_panel.sprite_cache, clear=True)
+    create_arrow_atlas = mocker.spy(weather_display.weather_panel, "create_arrow_atlas")
+
+    key = ("arrow", repr(config["weather"]["icon"]["arrow"]))
+    atlas = weather_display.weather_panel.get_sprite(
+        key, weather_display.weather_panel.create_arrow_atlas, arrow_icon
+    )
+    assert (
+        weather_display.weather_panel.get_sprite(
+            key, weather_display.weather_panel.create_arrow_atlas, arrow_icon
+        )
+        is atlas
+    )
+    assert create_arrow_atlas.call_count == 1
+
+    # NOTE: 静穏以外の 16 方位と 6 段階の風速の組み合わせ
+    assert len(atlas) == 16 * 6
+
+    # NOTE: その都度加工した場合と同じになること
+    expected = PIL.ImageEnhance.Brightness(arrow_icon).enhance(5.5).rotate(158, resample=PIL.Image.BICUBIC)
+    assert atlas[("北北東", weather_display.weather_panel.get_wind_level(3))].tobytes() == expected.tobytes()
+
+    assert weather_display.weather_panel.get_wind_level(0) == 0
+    assert weather_display.weather_panel.get_wind_level(4) == 4
+    assert weather_display.weather_panel.get_wind_level(12) == 5
+
+
+def test_weather_icon_cache(mocker, http_server):
+    import io
+    import urllib.error
+
+    import PIL.Image
+    import weather_display.weather_panel
+
+    ETAG = '"icon"'
+    request_list = []
+    error_code = {"value": None}
+
+    img_stream = io.BytesIO()
+    PIL.Image.new("RGBA", (80, 80), (0, 0, 0, 255)).save(img_stream, "PNG")
+    icon_data = img_stream.getvalue()
+
+    def do_get(handler):
+        request_list.append(handler.headers.get("If-None-Match"))
+        if error_code["value"] is not None:
+            handler.send_error(error_code["value"])
+            return
+        if handler.headers.get("If-None-Match") == ETAG:
+            handler.send_response(304)
+            handler.end_headers()
+            return
+
+        handler.send_data(icon_data, "image/png", {"ETag": ETAG})
+
+    server_url, server_stop = http_server(do_get)
+    url = f"{server_url}/31_day.png"
+
+    assert weather_display.weather_panel.fetch_icon(url) == icon_data
+    assert weather_display.weather_panel.fetch_icon(url) == icon_data
+    assert request_list == [None]
+
+    # NOTE: メモリ上のキャッシュが無くても，ファイルのキャッシュが使われること
+    weather_display.weather_panel.icon_cache.clear()
+    assert weather_display.weather_panel.fetch_icon(url) == icon_data
+    assert request_list == [None]
+
+    # NOTE: 期限が切れたら ETag で更新の有無を確認すること
+    mocker.patch.object(weather_display.weather_panel, "ICON_CACHE_REVALIDATE_HOUR", 0)
+    assert weather_display.weather_panel.fetch_icon(url) == icon_data
+    assert request_list == [None, ETAG]
+
+    # NOTE: サーバーがエラーを返しても，キャッシュしたアイコンが使われること
+    error_code["value"] = 503
+    assert weather_display.weather_panel.fetch_icon(url) == icon_data
+    assert request_list == [None, ETAG, ETAG]
+
+    # NOTE: アイコンが削除された場合はエラーにすること
+    error_code["value"] = 410
+    with pytest.raises(urllib.error.HTTPError):
+        weather_display.weather_panel.fetch_icon(url)
+
+    server_stop()
+
+    # NOTE: サーバーが応答しなくても，キャッシュしたアイコンが使われること
+    assert weather_display.weather_panel.fetch_icon(url) == icon_data
+
+
+def test_weather_icon_image_cache(mocker):
+    import io
+
+    import PIL.Image
+    import weather_display.weather_panel
+
+    icon_data_list = []
+    for color in [(0, 0, 0, 255), (128, 128, 128, 255)]:
+        img_stream = io.BytesIO()
+        PIL.Image.new("RGBA", (80, 80), color).save(img_stream, "PNG")
+        icon_data_list.append(img_stream.getvalue())
+
+    mocker.patch("weather_display.weather_panel.fetch_icon", return_value=icon_data_list[0])
+    convert_icon = mocker.spy(weather_display.weather_panel, "convert_icon")
+
+    weather_info = {
+        "text": "曇り",
+        "icon_url": "https://s.yimg.jp/images/weather/general/next/pinpoint/size80/31_day.png",
+    }
+    icon = weather_display.weather_panel.get_image(weather_info)
+    assert icon.mode == "LA"
+    assert icon.size == (152, 152)
+
+    # NOTE: 同じアイコンは変換済みのものが使われること
+    weather_display.weather_panel.get_image(weather_info)
+    weather_display.weather_panel.icon_image_cache.clear()
+    assert weather_display.weather_panel.get_image(weather_info).tobytes() == icon.tobytes()
+    assert convert_icon.call_count == 1
+
+    # NOTE: 取得済みのアイコンを事前に変換できること
+    for i, icon_data in enumerate(icon_data_list):
+        weather_display.weather_panel.save_cache(
+            weather_display.weather_panel.ICON_CACHE_PATH,
+            weather_display.weather_panel.icon_cache,
+            f"https://example.com/{i}.png",
+            {"data": icon_data, "etag": None, "last_modified": None, "time": 0},
+        )
+    assert weather_display.weather_panel.prewarm_icon() == 1
+    assert weather_display.weather_panel.prewarm_icon() == 0
+    assert convert_icon.call_count == 2
+
+    # NOTE: 超解像のモデルはプロセス内で使い回すこと
+    upsampler = weather_display.weather_panel.upsampler
+    assert upsampler is not None
+    weather_display.weather_panel.convert_icon(icon_data_list[1])
+    assert weather_display.weather_panel.upsampler is upsampler
+
+    # NOTE: 同じアイコンは一度だけ準備すること
+    image_map = weather_display.weather_panel.get_image_map([weather_info] * 12)
+    assert list(image_map.keys()) == [weather_info["icon_url"]]
+
+
+def test_weather_icon_dump(mocker, tmp_path):
+    import io
+
+    import PIL.Image
+    import weather_display.weather_panel
+
+    img_stream = io.BytesIO()
+    PIL.Image.new("RGBA", (80, 80), (0, 0, 0, 255)).save(img_stream, "PNG")
+
+    mocker.patch("weather_display.weather_panel.fetch_icon", return_value=img_stream.getvalue())
+    mocker.patch.object(weather_display.weather_panel, "ICON_DUMP_PATH", tmp_path)
+    mocker.patch.object(weather_display.weather_panel, "icon_dump_seen", set())
+    dump_icon = mocker.spy(weather_display.weather_panel, "dump_icon")
+
+    weather_info = {
+        "text": "曇り",
+        "icon_url": "https://s.yimg.jp/images/weather/general/next/pinpoint/size80/31_day.png",
+    }
+
+    # NOTE: 通常はアイコンを保存しないこと
+    mocker.patch.dict("os.environ", {"ICON_DUMP": "false"})
+    weather_display.weather_panel.get_image(weather_info)
+    assert dump_icon.call_count == 0
+
+    # NOTE: 保存を有効にした場合，初めて見つかったアイコンのみ保存すること
+    mocker.patch.dict("os.environ", {"ICON_DUMP": "true"})
+    future = weather_display.weather_panel.submit_icon_dump(img_stream.getvalue(), weather_info)
+    future.result()
+    weather_display.weather_panel.get_image(weather_info)
+    weather_display.weather_panel.get_image(weather_info)
+
+    assert dump_icon.call_count == 1
+    assert (tmp_path / "曇り_31_day.png").exists()
+
+
+def test_weather_icon_lut():
+    import math
+
+    import weather_display.weather_panel
+
+    # NOTE: 階調の削減とガンマ補正を順に行った場合と一致すること
+    for i in range(256):
+        tone = min(
+            math.ceil(i / weather_display.weather_panel.ICON_TONE) * weather_display.weather_panel.ICON_TONE,
+            255,
+        )
+        assert weather_display.weather_panel.ICON_LUT[i] == int(
+            255 * (float(tone) / 255) ** (1.0 / weather_display.weather_panel.ICON_GAMMA)
+        )
+
+
 ######################################################################
 def test_wbgt_panel(request, tmp_path):
     import weather_display.wbgt_panel
@@ -663,6 +989,12 @@ def test_create_rain_cloud_panel(request, tmp_path):
         0,
     )
 
+    # NOTE: 調整したウィンドウサイズが保存されていること
+    window_size_cache = weather_display.rain_cloud_panel.load_window_size_cache()
+    assert (int(config["rain_cloud"]["panel"]["width"] / 2), config["rain_cloud"]["panel"]["height"]) in [
+        key[:2] for key in window_size_cache
+    ]
+
     check_image(
         request,
         weather_display.rain_cloud_panel.create(config, is_side_by_side=False)[0],
@@ -805,6 +1137,321 @@ def test_create_rain_cloud_panel_xpath_error(mocker, request, tmp_path):
     check_notify_slack(None)
 
 
+@pytest.mark.xdist_group(name="Selenium")
+def test_create_rain_cloud_panel_single_page(mocker, request, tmp_path):
+    import weather_display.rain_cloud_panel
+
+    fetch_cloud_image_pair = mocker.spy(weather_display.rain_cloud_panel, "fetch_cloud_image_pair")
+    fetch_cloud_image = mocker.spy(weather_display.rain_cloud_panel, "fetch_cloud_image")
+
+    config = load_test_config(CONFIG_SMALL_FILE, tmp_path, request)
+    config["rain_cloud"]["data"]["jma"]["single_page"] = True
+
+    check_image(
+        request,
+        weather_display.rain_cloud_panel.create(config)[0],
+        config["rain_cloud"]["panel"],
+    )
+
+    # NOTE: 現在と１時間後の画像を１つのページから取得すること
+    assert fetch_cloud_image_pair.call_count == 1
+    assert fetch_cloud_image.call_count == 0
+
+    check_notify_slack(None)
+
+
+@pytest.mark.xdist_group(name="Selenium")
+def test_create_rain_cloud_panel_keep_driver(mocker, request, tmp_path):
+    import my_lib.selenium_util
+    import weather_display.rain_cloud_panel
+
+    # NOTE: 2回目もブラウザで取得させるため，キャッシュは使わない
+    mocker.patch("weather_display.rain_cloud_panel.load_cloud_cache", return_value=None)
+
+    config = load_test_config(CONFIG_SMALL_FILE, tmp_path, request)
+
+    create_driver = mocker.spy(my_lib.selenium_util, "create_driver")
+
+    weather_display.rain_cloud_panel.keep_driver()
+    try:
+        check_image(
+            request,
+            weather_display.rain_cloud_panel.create(config)[0],
+            config["rain_cloud"]["panel"],
+            0,
+        )
+        driver_map = dict(weather_display.rain_cloud_panel.driver_map)
+        assert sorted(driver_map.keys()) == ["rain_cloud", "rain_cloud_future"]
+        # NOTE: 都度起動されるプロセスとはプロファイルを分けること
+        assert all(call.args[0].endswith("_resident") for call in create_driver.call_args_list)
+
+        # NOTE: 2回目は同じブラウザが使われること
+        check_image(
+            request,
+            weather_display.rain_cloud_panel.create(config)[0],
+            config["rain_cloud"]["panel"],
+            1,
+        )
+        for profile_name, driver_info in driver_map.items():
+            assert (
+                weather_display.rain_cloud_panel.driver_map[profile_name]["driver"] is driver_info["driver"]
+            )
+            assert driver_info["count"] == 2
+    finally:
+        weather_display.rain_cloud_panel.keep_driver(False)
+
+    assert len(weather_display.rain_cloud_panel.driver_map) == 0
+
+    check_notify_slack(None)
+
+
+def test_rain_cloud_retouch():
+    import cv2
+    import numpy as np
+    import weather_display.rain_cloud_panel
+
+    config = my_lib.config.load(CONFIG_FILE)
+    level_count = len(weather_display.rain_cloud_panel.RAINFALL_INTENSITY_LEVEL)
+
+    # NOTE: 黄色 (30mm/h)，赤色 (80mm/h)，白地図，その他，紫色 (80mm/h 以上) の HSV
+    img_hsv = np.array(
+        [[[40, 255, 255], [4, 255, 255], [100, 10, 200], [100, 100, 100], [230, 255, 255]]], dtype=np.uint8
+    )
+    img, bar, rainfall_grid = weather_display.rain_cloud_panel.retouch_cloud_image(
+        cv2.cvtColor(img_hsv, cv2.COLOR_HSV2BGR_FULL), config["rain_cloud"]
+    )
+    # NOTE: 最も強い区分は，一つ下の区分より大きい値になること
+    assert rainfall_grid.tolist() == [[30, 80, 0, 0, weather_display.rain_cloud_panel.RAINFALL_INTENSITY_MAX]]
+    assert weather_display.rain_cloud_panel.RAINFALL_INTENSITY_MAX > 80
+    img_hsv = cv2.cvtColor(np.asarray(img)[:, :, :3], cv2.COLOR_RGB2HSV_FULL)
+
+    # NOTE: 強い雨ほど暗くなる
+    value_list = [int(value) for value in img_hsv[0, :, 2]]
+    assert value_list[0] > value_list[1]
+    assert value_list[0] == int(
+        255 * ((level_count - 4) / level_count) ** config["rain_cloud"]["legend"]["gamma"]
+    )
+    # NOTE: 白地図は明るさのみ調整し，それ以外はそのまま
+    assert value_list[2] == int(min(200**1.35 * 0.3, 255))
+    assert abs(value_list[3] - 100) <= 1
+
+    assert bar.size == (level_count, 1)
+
+
+def test_rain_cloud_overlay(mocker):
+    import numpy as np
+    import PIL.Image
+    import weather_display.rain_cloud_panel
+
+    config = my_lib.config.load(CONFIG_FILE)
+    face_map = weather_display.rain_cloud_panel.get_face_map(config["font"])
+    sub_panel_config = {"title": "現在"}
+    bar = PIL.Image.new("RGBA", (len(weather_display.rain_cloud_panel.RAINFALL_INTENSITY_LEVEL), 1))
+
+    draw_caption = mocker.spy(weather_display.rain_cloud_panel, "draw_caption")
+
+    weather_display.rain_cloud_panel.overlay_cache.clear()
+    for _ in range(2):
+        img, _, rainfall = weather_display.rain_cloud_panel.decorate_cloud_image(
+            PIL.Image.new("RGBA", (400, 300), (0, 0, 0, 255)),
+            bar,
+            np.zeros((300, 400), dtype=np.uint8),
+            sub_panel_config,
+            face_map,
+        )
+        assert rainfall == {"max": 0, "mean": 0.0, "coverage": 0.0}
+        # NOTE: 同心円の中心は白
+        assert img.getpixel((200, 150)) == (255, 255, 255, 255)
+
+    # NOTE: キャプションは一度だけ描画されること
+    assert draw_caption.call_count == 1
+
+
+def test_rain_cloud_wait_tile_loaded(mocker):
+    import selenium.common.exceptions
+    import weather_display.rain_cloud_panel
+
+    driver = mocker.MagicMock()
+
+    # NOTE: 読み込み中 → 読み込み完了 → 変化なし となった時点で完了とする
+    driver.execute_script.side_effect = [None, [4, 400, 300], [6, 400, 300], [6, 400, 300]]
+    weather_display.rain_cloud_panel.wait_tile_loaded(driver)
+    assert driver.execute_script.call_count == 4
+
+    mocker.patch("weather_display.rain_cloud_panel.TILE_LOAD_TIMEOUT", 0.3)
+    driver.execute_script.side_effect = None
+    driver.execute_script.return_value = None
+    with pytest.raises(selenium.common.exceptions.TimeoutException):
+        weather_display.rain_cloud_panel.wait_tile_loaded(driver)
+
+
+def test_rain_cloud_wait_tile_changed(mocker):
+    import selenium.common.exceptions
+    import weather_display.rain_cloud_panel
+
+    driver = mocker.MagicMock()
+    tile_src = ["base/0.png", "cloud/current/0.png"]
+
+    # NOTE: 切り替え前のタイルのままの間は待ち，入れ替わった時点で完了とする
+    driver.execute_script.side_effect = [tile_src, tile_src, ["base/0.png", "cloud/future/0.png"]]
+    weather_display.rain_cloud_panel.wait_tile_changed(driver, tile_src)
+    assert driver.execute_script.call_count == 3
+
+    mocker.patch("weather_display.rain_cloud_panel.TILE_LOAD_TIMEOUT", 0.3)
+    driver.execute_script.side_effect = None
+    driver.execute_script.return_value = tile_src
+    with pytest.raises(selenium.common.exceptions.TimeoutException):
+        weather_display.rain_cloud_panel.wait_tile_changed(driver, tile_src)
+
+
+@pytest.fixture()
+def tile_server(http_server):
+    import io
+    import json
+
+    import PIL.Image
+
+    BASETIME = "20240101000000"
+    TILE_COLOR = {
+        "base": (200, 200, 200, 255),
+        # NOTE: 黄色 (30mm/h) の雨雲
+        "cloud": (250, 245, 0, 255),
+    }
+
+    def do_get(handler):
+        path = handler.path.strip("/").split("/")
+        if path[0] == "time":
+            # NOTE: 予報は 5 分刻みで 1 時間後まで
+            validtime_list = (
+                [BASETIME]
+                if path[1] == "current.json"
+                else [f"20240101{minute // 60:02d}{minute % 60:02d}00" for minute in range(5, 65, 5)]
+            )
+            handler.send_data(
+                json.dumps(
+                    [
+                        {"basetime": BASETIME, "validtime": validtime, "elements": ["hrpns"]}
+                        for validtime in validtime_list
+                    ]
+                ).encode(),
+                "application/json",
+            )
+            return
+
+        tile_x, tile_y = int(path[-2]), int(path[-1].split(".")[0])
+        # NOTE: 雨雲のタイルは市松模様に欠けさせる
+        if (path[0] == "cloud") and ((tile_x + tile_y) % 2 == 1):
+            handler.send_error(404)
+            return
+
+        img_stream = io.BytesIO()
+        PIL.Image.new("RGBA", (256, 256), TILE_COLOR[path[0]]).save(img_stream, "PNG")
+        handler.send_data(img_stream.getvalue(), "image/png")
+
+    return http_server(do_get)[0]
+
+
+def test_create_rain_cloud_panel_tile(mocker, request, tmp_path, tile_server):
+    import weather_display.rain_cloud_panel
+
+    config = load_test_config(CONFIG_SMALL_FILE, tmp_path, request)
+    jma_config = config["rain_cloud"]["data"]["jma"]
+    jma_config["engine"] = "tile"
+    jma_config["target_time"] = {
+        "current": f"{tile_server}/time/current.json",
+        "future": f"{tile_server}/time/future.json",
+    }
+    jma_config["tile"] = {
+        "base": {"url": tile_server + "/base/{z}/{x}/{y}.png"},
+        "cloud": {"url": tile_server + "/cloud/{basetime}/{validtime}/{z}/{x}/{y}.png", "zoom_max": 10},
+    }
+
+    basetime = weather_display.rain_cloud_panel.fetch_basetime(jma_config["target_time"])
+    img = weather_display.rain_cloud_panel.fetch_cloud_image_tile(
+        jma_config["url"],
+        jma_config["tile"],
+        300,
+        200,
+        weather_display.rain_cloud_panel.fetch_target_time(jma_config["target_time"], basetime, True),
+    )
+    assert img.shape == (200, 300, 3)
+
+    fetch_cloud_image_tile = mocker.spy(weather_display.rain_cloud_panel, "fetch_cloud_image_tile")
+
+    check_image(
+        request,
+        weather_display.rain_cloud_panel.create(config)[0],
+        config["rain_cloud"]["panel"],
+        0,
+    )
+    assert fetch_cloud_image_tile.call_count == 2
+
+    # NOTE: 観測時刻が同じなので，キャッシュが使われること
+    check_image(
+        request,
+        weather_display.rain_cloud_panel.create(config)[0],
+        config["rain_cloud"]["panel"],
+        1,
+    )
+    assert fetch_cloud_image_tile.call_count == 2
+
+    # NOTE: 雨雲の量が集計されていること．同心円の範囲は全て黄色 (30mm/h) のタイルに収まる
+    rainfall = weather_display.rain_cloud_panel.load_rainfall()
+    assert rainfall["basis"] == "class_upper_bound"
+    for name in ["current", "future"]:
+        assert rainfall[name] == {"max": 30, "mean": 30.0, "coverage": 100.0}
+
+    check_notify_slack(None)
+
+
+def test_create_rain_cloud_nowcast(mocker, request, tmp_path, tile_server):
+    import weather_display.rain_cloud_panel
+
+    config = load_test_config(CONFIG_SMALL_FILE, tmp_path, request)
+    jma_config = config["rain_cloud"]["data"]["jma"]
+    jma_config["target_time"] = {
+        "current": f"{tile_server}/time/current.json",
+        "future": f"{tile_server}/time/future.json",
+    }
+    jma_config["tile"] = {
+        "base": {"url": tile_server + "/base/{z}/{x}/{y}.png"},
+        "cloud": {"url": tile_server + "/cloud/{basetime}/{validtime}/{z}/{x}/{y}.png", "zoom_max": 10},
+    }
+
+    assert weather_display.rain_cloud_panel.is_nowcast_available(config["rain_cloud"])
+
+    fetch_cloud_image_tile_list = mocker.spy(weather_display.rain_cloud_panel, "fetch_cloud_image_tile_list")
+
+    sequence = weather_display.rain_cloud_panel.create_nowcast_sequence(
+        config["rain_cloud"], config["font"], 10
+    )
+
+    # NOTE: 現在と 10 分刻みで 1 時間後までの 7 フレーム
+    assert [rainfall["minute"] for rainfall in sequence["series"]] == [0, 10, 20, 30, 40, 50, 60]
+    assert len(sequence["frame"]) == 7
+    for frame in sequence["frame"]:
+        assert frame.size == (
+            int(config["rain_cloud"]["panel"]["width"] / 2),
+            config["rain_cloud"]["panel"]["height"],
+        )
+    # NOTE: 同心円の範囲は全て黄色 (30mm/h) のタイルに収まるので，現在から雨が降っている
+    for rainfall in sequence["series"]:
+        assert (rainfall["max"], rainfall["mean"], rainfall["coverage"]) == (30, 30.0, 100.0)
+    assert sequence["arrival"] == 0
+    assert weather_display.rain_cloud_panel.load_nowcast()["series"] == sequence["series"]
+
+    # NOTE: 観測時刻が同じなので，キャッシュが使われること
+    weather_display.rain_cloud_panel.create_nowcast_sequence(config["rain_cloud"], config["font"], 10)
+    assert fetch_cloud_image_tile_list.call_count == 1
+
+    weather_display.rain_cloud_panel.create_nowcast_sequence(config["rain_cloud"], config["font"], 5)
+    assert fetch_cloud_image_tile_list.call_count == 2
+    assert len(weather_display.rain_cloud_panel.load_nowcast()["series"]) == 13
+
+    with pytest.raises(ValueError, match="予報の間隔が不正です"):
+        weather_display.rain_cloud_panel.create_nowcast_sequence(config["rain_cloud"], config["font"], 7)
+
+
 ######################################################################
 def test_slack_error(mocker, request, tmp_path):
     import create_image
@@ -884,7 +1531,6 @@ def test_index_with_other_status(client, mocker):
 
 
 def test_api_run(client, mocker):
-    import gzip
     import inspect
     import io
 
@@ -949,15 +1595,35 @@ def test_api_run(client, mocker):
 
     response = client.post(
         f"{my_lib.webapp.config.URL_PREFIX}/api/image",
-        headers={"Accept-Encoding": "gzip"},
         data={"token": token},
     )
     assert response.status_code == 200
-    image_data = gzip.decompress(response.data)
+    assert response.mimetype == "image/png"
+    image_data = response.data
     # NOTE: サイズが適度にあり，PNG として解釈できれば OK とする
     assert len(image_data) > 1024
     assert PIL.Image.open(io.BytesIO(image_data)).size == (3200, 1800)
 
+    # NOTE: 画像が変わっていなければ 304 を返す
+    etag = response.headers["ETag"]
+    response = client.post(
+        f"{my_lib.webapp.config.URL_PREFIX}/api/image",
+        headers={"If-None-Match": etag},
+        data={"token": token},
+    )
+    assert response.status_code == 304
+
+    # NOTE: 受け入れ可能であれば WebP で返す
+    response = client.post(
+        f"{my_lib.webapp.config.URL_PREFIX}/api/image",
+        headers={"Accept": "image/webp,*/*;q=0.8", "If-None-Match": etag},
+        data={"token": token},
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "image/webp"
+    assert response.headers["ETag"] != etag
+    assert PIL.Image.open(io.BytesIO(response.data)).size == (3200, 1800)
+
 
 def test_api_run_small(client, mocker):
     import inspect
@@ -998,6 +1664,48 @@ def test_api_run_small(client, mocker):
     assert response.data.decode()
 
 
+def test_api_tile(client):
+    import base64
+    import io
+    import json
+
+    import PIL.Image
+
+    config = my_lib.config.load(CONFIG_SMALL_FILE)
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/run", query_string={"mode": "small"})
+    assert response.status_code == 200
+
+    token = response.json["token"]
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/tile", query_string={"token": token})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    tile_list = [
+        json.loads(line[len("data: ") :])
+        for line in response.data.decode().splitlines()
+        if line.startswith("data: {")
+    ]
+    assert response.data.decode().rstrip().endswith("event: done\ndata:")
+
+    # NOTE: 描画した全パネルが，配置先の座標付きで送られてくること
+    assert sorted(tile["name"] for tile in tile_list) == ["rain_cloud", "time", "wbgt", "weather"]
+    for tile in tile_list:
+        assert tile["offset_x"] == config[tile["name"]]["panel"]["offset_x"]
+        assert tile["offset_y"] == config[tile["name"]]["panel"]["offset_y"]
+        assert tile["device_width"] == config["panel"]["device"]["width"]
+        assert PIL.Image.open(io.BytesIO(base64.b64decode(tile["image"]))).size == (
+            tile["width"],
+            tile["height"],
+        )
+
+    response = client.post(f"{my_lib.webapp.config.URL_PREFIX}/api/log", data={"token": token})
+    assert response.status_code == 200
+    # NOTE: ログを出し切るまで待つ
+    assert response.data.decode()
+
+
 def test_api_run_error(client, mocker):
     mocker.patch("weather_display.generator.generate_image", side_effect=RuntimeError())
 
@@ -1069,6 +1777,161 @@ def test_api_run_normal(mocker):
     client.delete()
 
 
+def test_api_image_latest(client, tmp_path):
+    import io
+
+    import PIL.Image
+    import weather_display.generator
+
+    weather_display.generator.latest_image_map.clear()
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/image", query_string={"mode": "small"})
+    assert response.status_code == 503
+
+    assert weather_display.generator.render_latest_image(CONFIG_FILE, False, True, is_test_mode=True)
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/image")
+    assert response.status_code == 200
+    assert PIL.Image.open(io.BytesIO(response.data)).size == (3200, 1800)
+
+    # NOTE: display_image.py が保存した画像の方が新しければ，そちらを配信する
+    frame_file = tmp_path / "frame.png"
+    frame_file.write_bytes(b"FRAME")
+    assert weather_display.generator.load_frame_file("small", frame_file)
+    assert not weather_display.generator.load_frame_file("small", frame_file)
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/image", query_string={"mode": "small"})
+    assert response.status_code == 200
+    assert response.data == b"FRAME"
+
+
+def test_prerender_target(tmp_path):
+    import weather_display.generator
+
+    weather_display.generator.latest_image_map.clear()
+    weather_display.generator.requested_mode_set.clear()
+
+    prerender_param = {
+        "config_file": {"normal": CONFIG_FILE, "small": str(tmp_path / "not_exist.yaml")},
+        "is_dummy_mode": True,
+    }
+
+    # NOTE: 読めない設定ファイルのモードは対象外
+    assert weather_display.generator.load_prerender_target(prerender_param, True) is None
+
+    target = weather_display.generator.load_prerender_target(prerender_param, False)
+    target["frame_file"] = tmp_path / "frame.png"
+
+    # NOTE: 要求されておらず，display_image.py の画像も無ければ生成しない
+    assert not weather_display.generator.is_prerender_needed(target)
+
+    target["frame_file"].write_bytes(b"FRAME")
+    assert weather_display.generator.is_prerender_needed(target)
+
+    # NOTE: 取り込んだ画像が新しいうちは生成しない
+    assert weather_display.generator.load_frame_file(target["mode"], target["frame_file"])
+    assert not weather_display.generator.is_prerender_needed(target)
+
+    target["frame_file"].unlink()
+    weather_display.generator.latest_image_map.clear()
+    weather_display.generator.request_latest_image(target["mode"])
+    assert weather_display.generator.is_prerender_needed(target)
+
+
+def test_api_panel(client):
+    import io
+
+    import PIL.Image
+
+    config = my_lib.config.load(CONFIG_FILE)
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/panel/time")
+    assert response.status_code == 200
+    assert "Server-Timing" in response.headers
+    assert PIL.Image.open(io.BytesIO(response.data)).size == (
+        config["time"]["panel"]["width"],
+        config["time"]["panel"]["height"],
+    )
+
+    # NOTE: 小型ディスプレイモードには存在しないパネル
+    response = client.get(
+        f"{my_lib.webapp.config.URL_PREFIX}/api/panel/sensor", query_string={"mode": "small"}
+    )
+    assert response.status_code == 404
+
+
+def test_create_nowcast_cache(mocker):
+    import my_lib.pil_util
+    import PIL.Image
+    import weather_display.generator
+
+    config = my_lib.config.load(CONFIG_FILE)
+
+    def create_sequence(color):
+        return {
+            "basetime": "20240101000000",
+            "step": 10,
+            "series": [],
+            "arrival": None,
+            "frame": [PIL.Image.new("RGBA", (40, 30), (color, color, color, 255)) for _ in range(2)],
+        }
+
+    create_nowcast_sequence = mocker.patch(
+        "weather_display.rain_cloud_panel.create_nowcast_sequence", return_value=create_sequence(0)
+    )
+    convert_to_gray = mocker.spy(my_lib.pil_util, "convert_to_gray")
+
+    nowcast, image_data = weather_display.generator.create_nowcast(config, 10)
+    assert "frame" not in nowcast
+
+    # NOTE: 予報が同じであれば，エンコードし直さないこと
+    assert weather_display.generator.create_nowcast(config, 10)[1] is image_data
+    assert convert_to_gray.call_count == 2
+
+    create_nowcast_sequence.return_value = create_sequence(255)
+    assert weather_display.generator.create_nowcast(config, 10)[1] != image_data
+    assert convert_to_gray.call_count == 4
+
+
+def test_api_nowcast(client, mocker):
+    import io
+
+    import PIL.Image
+
+    frame_list = [PIL.Image.new("L", (40, 30), color) for color in [0, 128, 255]]
+    img_stream = io.BytesIO()
+    frame_list[0].save(img_stream, "PNG", save_all=True, append_images=frame_list[1:], duration=500, loop=0)
+    nowcast = {
+        "basetime": "20240101000000",
+        "step": 10,
+        "series": [{"validtime": "20240101000000", "minute": 0, "max": 0, "mean": 0.0, "coverage": 0.0}],
+        "arrival": None,
+    }
+    render_nowcast = mocker.patch(
+        "weather_display.generator.render_nowcast", return_value=(nowcast, img_stream.getvalue())
+    )
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/nowcast", query_string={"step": 5})
+    assert response.status_code == 200
+    assert response.json == nowcast
+    assert render_nowcast.call_args.args[1] == 5
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/nowcast/image")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert PIL.Image.open(io.BytesIO(response.data)).n_frames == 3
+
+    # NOTE: 予報が更新されていなければ 304 が返ること
+    response = client.get(
+        f"{my_lib.webapp.config.URL_PREFIX}/api/nowcast/image",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+    response = client.get(f"{my_lib.webapp.config.URL_PREFIX}/api/nowcast", query_string={"step": 7})
+    assert response.status_code == 400
+
+
 ######################################################################
 
 
@@ -1357,3 +2220,48 @@ def test_display_image_error_unknown(mocker, tmp_path, request):
     # NOTE: 本来，create_image の中で通知されているので，上記の故障注入方法では通知はされない
     check_notify_slack(None)
     check_liveness(config, False)
+
+
+def test_api_async(app):
+    import asyncio
+    import io
+    import json
+
+    import PIL.Image
+    import weather_display.generator_async
+
+    assert weather_display.generator_async.is_async_path(f"{my_lib.webapp.config.URL_PREFIX}/api/log")
+    assert not weather_display.generator_async.is_async_path(f"{my_lib.webapp.config.URL_PREFIX}/api/memory")
+
+    async_app = webapp.create_async_app(CONFIG_FILE, CONFIG_SMALL_FILE, dummy_mode=True)
+
+    async def run():
+        client = async_app.test_client()
+
+        response = await client.get(
+            f"{my_lib.webapp.config.URL_PREFIX}/api/run",
+            query_string={"mode": "small", "test": True, "callback": "TEST"},
+        )
+        assert response.status_code == 200
+
+        m = re.compile(r"TEST\((.*)\)", re.MULTILINE | re.DOTALL).match(await response.get_data(as_text=True))
+        assert m is not None
+        token = json.loads(m.group(1))["token"]
+
+        response = await client.post(f"{my_lib.webapp.config.URL_PREFIX}/api/log", form={"token": token})
+        assert response.status_code == 200
+        # NOTE: ログを出し切るまで待つ
+        assert await response.get_data(as_text=True)
+
+        response = await client.post(f"{my_lib.webapp.config.URL_PREFIX}/api/image", form={"token": token})
+        assert response.status_code == 200
+        assert PIL.Image.open(io.BytesIO(await response.get_data())).size == (2200, 1650)
+
+        response = await client.post(
+            f"{my_lib.webapp.config.URL_PREFIX}/api/image",
+            headers={"If-None-Match": response.headers["ETag"]},
+            form={"token": token},
+        )
+        assert response.status_code == 304
+
+    asyncio.run(run())